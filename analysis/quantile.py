@@ -1,22 +1,209 @@
 #!/usr/bin/env python3
 import sys
+import os
 import argparse
 import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plot'))
+import input_helper
+
+class KLL:
+    '''
+    KLL quantile sketch. Level h holds values that each stand for 2^h
+    input values; when a level outgrows its capacity it is sorted and every
+    other value (from a random offset) is promoted to the next level.
+    Capacities shrink by 2/3 per level below the top, so the sketch keeps
+    O(k) values and the rank error is about 3.3/k of n. Values are added in
+    whole NumPy arrays, and two sketches merge by concatenating levels.
+    '''
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def for_error(cls, error):
+        return cls(k=int(np.ceil(3.3 / error)))
+
+    def capacity(self, h):
+        return max(int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - h))), 2)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                level = np.sort(level)
+                # an odd value out stays behind so the promoted half is exact
+                keep = level[:len(level) % 2]
+                level = level[len(keep):]
+                promoted = level[self.rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    def quantiles(self, qs):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cum = values[order], np.cumsum(weights[order])
+        ranks = np.asarray(qs) * cum[-1]
+        out = values[np.minimum(np.searchsorted(cum, ranks, side='left'), len(values) - 1)]
+        # the extremes are tracked exactly
+        return np.where(np.asarray(qs) <= 0, self.min, np.where(np.asarray(qs) >= 1, self.max, out))
+
+    def save(self, path):
+        arrays = {f'level{h}': level for h, level in enumerate(self.levels)}
+        np.savez(path, meta=np.array([self.k, self.n, self.min, self.max], dtype=float), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            k, n, lo, hi = f['meta']
+            sketch = cls(k=int(k))
+            sketch.levels = [f[f'level{h}'] for h in range(len(f.files) - 1)]
+        sketch.n, sketch.min, sketch.max = int(n), lo, hi
+        return sketch
+
+def print_quantiles(qs, values):
+    # a single quantile prints just the value, as before
+    if len(qs) == 1:
+        print(values[0])
+        return
+    for q, v in zip(qs, values):
+        print(f'{q}\t{v}')
+
+def resolve(spec, columns):
+    '''Column labels for a comma-separated list of names or 1-based column numbers.'''
+    labels = []
+    for c in spec.split(','):
+        if c not in columns and c.isdigit():
+            c = columns[int(c) - 1]
+        assert c in columns, f'Column {c} not found in {list(columns)}'
+        labels.append(c)
+    return labels
+
+def grouped_quantiles(args, qs):
+    '''
+    Quantiles of each --value-cols column within each --group-col group,
+    in one pass over a delimited stdin, as a tidy table. Exact mode keeps
+    the value columns and computes all groups at once with groupby;
+    --sketch keeps one KLL sketch per group and column.
+    '''
+    header = 0 if args.header else None
+    sketches = {}
+    parts = []
+    group = values = None
+    for chunk in pd.read_csv(args.input or sys.stdin, sep=args.sep, header=header, chunksize=args.chunksize):
+        if values is None:
+            columns = list(chunk.columns)
+            if not args.header:
+                # without a header pandas numbers columns from 0
+                columns = [str(c + 1) for c in columns]
+            chunk.columns = columns
+            values = resolve(args.value_cols, columns)
+            group = resolve(args.group_col, columns)[0] if args.group_col else None
+        else:
+            chunk.columns = columns
+        chunk = chunk[([group] if group else []) + values]
+        if not args.sketch:
+            parts.append(chunk)
+            continue
+        for g, df in (chunk.groupby(group, sort=False, dropna=False) if group else [(None, chunk)]):
+            for col in values:
+                sketches.setdefault((g, col), KLL.for_error(args.error)).update(df[col].to_numpy(dtype=float))
+
+    if values is None:
+        print("No values provided on stdin.", file=sys.stderr)
+        sys.exit(1)
+    if args.sketch:
+        rows = [(g, col, q, v) for (g, col), sketch in sketches.items() if sketch.n
+                for q, v in zip(qs, sketch.quantiles(qs))]
+        out = pd.DataFrame(rows, columns=['group', 'column', 'quantile', 'value'])
+    else:
+        df = pd.concat(parts, ignore_index=True)
+        grouped = df.groupby(group, sort=False, dropna=False)[values] if group else df[values]
+        out = grouped.quantile(qs)
+        out = out.stack(future_stack=True).rename('value').reset_index()
+        out.columns = (['group'] if group else []) + ['quantile', 'column', 'value']
+        out = out.dropna(subset=['value'])
+    by = [group] if group else []
+    out = out.rename(columns={'group': group})[by + ['column', 'quantile', 'value']]
+    out.sort_values(by + ['column', 'quantile'], kind='stable').to_csv(sys.stdout, sep='\t', index=False)
 
 def main():
     parser = argparse.ArgumentParser(description="Compute empirical quantile from a column of values on stdin.")
-    parser.add_argument('-q', '--quantile', type=float, required=True, help='Quantile to compute (e.g., 0.75 for 75th percentile)')
+    parser.add_argument('-q', '--quantile', type=str, required=True, help='Quantile(s) to compute, comma separated (e.g., 0.75 for 75th percentile, or 0.5,0.9,0.99)')
+    parser.add_argument('--sketch', action='store_true', help='Stream stdin through a KLL sketch in bounded memory instead of holding every value')
+    parser.add_argument('--error', type=float, default=0.01, help='With --sketch, approximate rank error as a fraction of n (default: 0.01)')
+    parser.add_argument('--save', type=str, default=None, help='With --sketch, also write the sketch to this .npz file so it can be merged later')
+    parser.add_argument('--merge', type=str, nargs='+', default=None, help='Sketch files to merge (e.g. one per shard) instead of reading stdin')
+    parser.add_argument('--group-col', type=str, default=None, help='Column (name, or 1-based number) to group by; stdin is then a delimited table')
+    parser.add_argument('--value-cols', type=str, default=None, help='Comma-separated columns (names, or 1-based numbers) to compute quantiles of; output is a table of group, column, quantile, value')
+    parser.add_argument('--header', action='store_true', help='With --value-cols, stdin has a header row')
+    parser.add_argument('--sep', default='\t', help='With --value-cols, column separator (default: tab)')
+    parser.add_argument('--chunksize', type=int, default=1000000, help='Lines read from stdin at a time in --sketch and --value-cols modes (default: 1000000)')
+    input_helper.add_input_args(parser)
     args = parser.parse_args()
+    qs = [float(q) for q in args.quantile.split(',')]
+
+    if args.group_col or args.value_cols:
+        assert args.value_cols, '--group-col needs --value-cols'
+        assert not (args.save or args.merge), '--save and --merge are for a single column of values'
+        grouped_quantiles(args, qs)
+        return
+
+    if args.sketch or args.merge:
+        if args.merge:
+            sketch = KLL.load(args.merge[0])
+            for path in args.merge[1:]:
+                sketch.merge(KLL.load(path))
+        else:
+            sketch = KLL.for_error(args.error)
+            for values in input_helper.iter_numeric(args.input, args, ncols=1, chunksize=args.chunksize):
+                sketch.update(values[:, 0])
+        if args.save:
+            sketch.save(args.save)
+        if sketch.n == 0:
+            print("No values provided on stdin.", file=sys.stderr)
+            sys.exit(1)
+        print_quantiles(qs, sketch.quantiles(qs))
+        return
 
-    # Read values from stdin, stripping whitespace and ignoring empty lines
-    values = [float(line.strip()) for line in sys.stdin if line.strip()]
+    # Read values in bulk (text without empty lines, or memory-mapped binary)
+    values = input_helper.load_column(args.input, args)
 
-    if not values:
+    if not len(values):
         print("No values provided on stdin.", file=sys.stderr)
         sys.exit(1)
 
-    quantile_value = np.quantile(values, args.quantile)
-    print(quantile_value)
+    print_quantiles(qs, np.quantile(values, qs))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
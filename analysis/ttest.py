@@ -1,22 +1,155 @@
 #!/usr/bin/env python3
 import argparse
+import os
+import sys
+import numpy as np
 import pandas as pd
-from scipy.stats import ttest_ind
+from scipy.stats import ttest_ind, t as t_dist
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plot'))
+import input_helper
+
+def tests(x, y, alternative):
+    '''
+    Two-sample t-tests of each row of x against the same row of y, all
+    rows at once. NaNs are left out of each row's statistics. As in the
+    single test, rows whose variance ratio is below 4 get Student's test
+    and the rest Welch's.
+    '''
+    nx, ny = (~np.isnan(x)).sum(axis=1), (~np.isnan(y)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx, my = np.nanmean(x, axis=1), np.nanmean(y, axis=1)
+        vx, vy = np.nanvar(x, axis=1, ddof=1), np.nanvar(y, axis=1, ddof=1)
+        high, low = np.maximum(vx, vy), np.minimum(vx, vy)
+        var_ratio = np.where(low > 0, high / low, np.inf)
+        equal_var = var_ratio < 4
+
+        pooled = ((nx - 1) * vx + (ny - 1) * vy) / (nx + ny - 2)
+        se_student = np.sqrt(pooled * (1 / nx + 1 / ny))
+        sx, sy = vx / nx, vy / ny
+        se_welch = np.sqrt(sx + sy)
+        df_welch = (sx + sy) ** 2 / (sx ** 2 / (nx - 1) + sy ** 2 / (ny - 1))
+
+        se = np.where(equal_var, se_student, se_welch)
+        df = np.where(equal_var, nx + ny - 2, df_welch)
+        tstat = (mx - my) / se
+    if alternative == 'two-sided':
+        pval = 2 * t_dist.sf(np.abs(tstat), df)
+    elif alternative == 'less':
+        pval = t_dist.cdf(tstat, df)
+    else:
+        pval = t_dist.sf(tstat, df)
+    return pd.DataFrame({'n1': nx, 'n2': ny, 'mean1': mx, 'mean2': my, 'var1': vx, 'var2': vy,
+                         'var_ratio': var_ratio, 'equal_var': equal_var, 't': tstat, 'df': df, 'p': pval})
+
+def bh_qvalues(p):
+    '''Benjamini-Hochberg q-values; NaN p-values stay NaN and do not count as tests.'''
+    q = np.full(len(p), np.nan)
+    tested = np.nonzero(~np.isnan(p))[0]
+    order = tested[np.argsort(p[tested], kind='stable')]
+    m = len(order)
+    ranked = p[order] * m / np.arange(1, m + 1)
+    # q of the i-th smallest p is the smallest ranked value from i on
+    q[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return q
+
+def read_groups(path, samples):
+    '''
+    Group label of each sample: the file has either one label per line, in
+    the order of the matrix columns, or sample<TAB>label lines.
+    '''
+    groups = pd.read_csv(path, sep='\t', header=None, dtype=str)
+    if groups.shape[1] == 1:
+        assert len(groups) == len(samples), f'{path} has {len(groups)} labels for {len(samples)} samples'
+        return groups[0].to_numpy()
+    labels = dict(zip(groups[0], groups[1]))
+    return np.array([labels.get(str(s)) for s in samples], dtype=object)
+
+def matrix_chunks(args):
+    '''(feature ids, samples, values) for --chunksize features at a time of a features x samples matrix.'''
+    if input_helper.input_format(args.input, args) != 'text':
+        data = input_helper.load_numeric(args.input, args)
+        samples = list(range(data.shape[1]))
+        for i in range(0, len(data), args.chunksize):
+            yield np.arange(i, min(i + args.chunksize, len(data))), samples, np.asarray(data[i:i + args.chunksize], dtype=float)
+        return
+    for chunk in pd.read_csv(args.input, sep=args.sep, index_col=0, chunksize=args.chunksize):
+        yield chunk.index.to_numpy(), list(chunk.columns), chunk.to_numpy(dtype=float)
+
+def batch_matrix(args):
+    '''One test per feature (row) of the matrix, comparing the samples (columns) of two groups.'''
+    results = []
+    for ids, samples, values in matrix_chunks(args):
+        if not results:
+            labels = read_groups(args.groups, samples)
+            names = sorted({l for l in labels if l is not None and l == l})
+            assert len(names) == 2 or (args.group1 and args.group2), f'Groups {names} found; choose two with --group1 and --group2'
+            # with two labels, a missing --group1 or --group2 is the other label
+            group1 = args.group1 or next((n for n in names if n != args.group2), None)
+            group2 = args.group2 or next((n for n in names if n != group1), None)
+            assert group1 in names and group2 in names, f'--group1 {group1} and --group2 {group2} must be among the groups {names}'
+            assert group1 != group2, f'--group1 and --group2 are both {group1}'
+            in1, in2 = labels == group1, labels == group2
+            print(f'{group1}: {in1.sum()} samples, {group2}: {in2.sum()} samples', file=sys.stderr)
+        res = tests(values[:, in1], values[:, in2], args.alternative)
+        res.insert(0, 'feature', ids)
+        results.append(res)
+    return pd.concat(results, ignore_index=True)
+
+def batch_pairs(args):
+    '''One test per column1:column2 pair of a table, --chunksize pairs at a time.'''
+    header = 0 if args.header else None
+    df = pd.read_csv(args.input, sep=args.sep, header=header)
+    # without a header pandas numbers columns from 0
+    columns = [str(c) for c in df.columns] if args.header else [str(c + 1) for c in df.columns]
+    df.columns = columns
+
+    def column(c):
+        # a name, or a 1-based column number
+        return c if c in columns else columns[int(c) - 1]
+    pairs = [tuple(column(c) for c in pair.split(':')) for pair in args.pairs.split(',')]
+    results = []
+    for i in range(0, len(pairs), args.chunksize):
+        chunk = pairs[i:i + args.chunksize]
+        x = df[[a for a, _ in chunk]].to_numpy(dtype=float).T
+        y = df[[b for _, b in chunk]].to_numpy(dtype=float).T
+        res = tests(x, y, args.alternative)
+        res.insert(0, 'feature', [f'{a}:{b}' for a, b in chunk])
+        results.append(res)
+    return pd.concat(results, ignore_index=True)
 
 def main():
-    parser = argparse.ArgumentParser(description="Two-sample t-test for two columns in a table.")
-    parser.add_argument('-i', '--input', required=True, help='Input table file (2 columns, no header or with header)')
+    parser = argparse.ArgumentParser(description="Two-sample t-test for two columns in a table, or batch tests over many features with BH q-values.")
+    parser.add_argument('-i', '--input', required=True, help='Input table file (2 columns, no header or with header), or a two-column .npy/.npz/raw float array')
     parser.add_argument('--header', action='store_true', help='Specify if the input file has a header row')
     parser.add_argument('--sep', default='\t', help='Column separator (default: tab)')
     parser.add_argument('-a', '--alternative', choices=['two-sided', 'less', 'greater'], default='two-sided',)
+    parser.add_argument('-g', '--groups', help='Batch mode: -i is a features x samples matrix (feature ids in the first column, sample names in the header, or a .npy array) and this file gives the group of each sample')
+    parser.add_argument('--group1', help='With --groups, label of the first group (required with more than two labels; default: the first of two, sorted)')
+    parser.add_argument('--group2', help='With --groups, label of the second group (required with more than two labels; default: the other label)')
+    parser.add_argument('-p', '--pairs', help='Batch mode: test each column1:column2 pair of -i (names or 1-based numbers, comma separated)')
+    parser.add_argument('-o', '--output', help='Batch mode output table (default: stdout)')
+    parser.add_argument('--chunksize', type=int, default=5000, help='Batch mode: features tested at a time (default: 5000)')
+    input_helper.add_input_args(parser, input=False)
     args = parser.parse_args()
 
-    header = 0 if args.header else None
-    df = pd.read_csv(args.input, sep=args.sep, header=header)
-    assert df.shape[1] != 2, "Input table must have exactly 2 columns."
+    if args.groups or args.pairs:
+        results = batch_matrix(args) if args.groups else batch_pairs(args)
+        results['q'] = bh_qvalues(results['p'].to_numpy())
+        results.to_csv(args.output or sys.stdout, sep='\t', index=False)
+        return
+
+    if input_helper.input_format(args.input, args) != 'text':
+        data = input_helper.load_numeric(args.input, args)
+        assert data.shape[1] == 2, "Input array must have exactly 2 columns."
+        x = data[:, 0][~np.isnan(data[:, 0])]
+        y = data[:, 1][~np.isnan(data[:, 1])]
+    else:
+        header = 0 if args.header else None
+        df = pd.read_csv(args.input, sep=args.sep, header=header)
+        assert df.shape[1] == 2, "Input table must have exactly 2 columns."
 
-    x = df.iloc[:, 0].dropna().values
-    y = df.iloc[:, 1].dropna().values
+        x = df.iloc[:, 0].dropna().values
+        y = df.iloc[:, 1].dropna().values
 
     var_x = x.var(ddof=1)
     var_y = y.var(ddof=1)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import argparse
+import os
+import sys
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -9,6 +11,8 @@ from sklearn.metrics import roc_auc_score, average_precision_score, roc_curve, p
 from sklearn.preprocessing import StandardScaler
 import numpy as np
 from matplotlib.colors import LogNorm
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wrangle'))
+import wrangle_helper
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Thorough logistic regression evaluation with ElasticNet")
@@ -21,6 +25,7 @@ def parse_args():
     parser.add_argument('-fns', '--false_negatives', type=int, help='Number of false negatives to include when reporting results', default=None)
     parser.add_argument('-p', '--cpus', type=int, default=1, help='Number of CPU cores to use (default: 1)')
     parser.add_argument('--tune_metric', type=str, choices=['auroc', 'auprc'], default='auroc', help='Metric to tune hyperparameters (auroc or auprc, default: auroc)')
+    wrangle_helper.add_cache_args(parser)
     return parser.parse_args()
 
 def random_hyperparams(seed):
@@ -119,7 +124,7 @@ def main():
     })
 
     # Load data
-    df = pd.read_csv(args.input, sep="\t")
+    df = wrangle_helper.read_csv_cached(args.input, args, sep="\t")
     y = df.iloc[:, args.label_col - 1].values
     X = df.drop(df.columns[args.label_col - 1], axis=1).values
     feat_names = df.drop(df.columns[args.label_col - 1], axis=1).columns.tolist()
@@ -4,6 +4,9 @@ import numpy as np
 import pandas as pd
 import re
 import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'wrangle'))
+import wrangle_helper
 
 parser = argparse.ArgumentParser(description='Standard scale a data matrix')
 parser.add_argument('-i', '--input', type=str, required=True, help='Input file with data matrix')
@@ -11,6 +14,7 @@ parser.add_argument('-o', '--output', type=str, required=True, help='Output file
 # parser.add_argument('-c', '--columns', type=str, default=None, help='Columns to standardize, comma-separated. If None, all columns are standardized')
 parser.add_argument('--header', action='store_true', help='Indicate that the first line of input is a header with column names.')
 parser.add_argument('-s', '--stats', type=str, default=None, help='File to save statistics (mean and std) for each column')
+wrangle_helper.add_cache_args(parser)
 args = parser.parse_args()
 
 # if args.columns:
@@ -24,12 +28,8 @@ args = parser.parse_args()
 #     col_idx.sort()
 #     print(f"Column indices to standardize: {col_idx}")
 
-df = pd.read_csv(args.input, sep='\t', header=0 if args.header else None)
-if args.columns:
-    cols = [df.columns[i] for i in col_idx]
-    df = df[cols]
-else:
-    cols = df.columns.tolist()
+df = wrangle_helper.read_csv_cached(args.input, args, sep='\t', header=0 if args.header else None)
+cols = df.columns.tolist()
 
 # standardize each column
 means = {}
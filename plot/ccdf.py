@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
-import sys
 import argparse
 import matplotlib.pyplot as plt
 import plot_helper
-from collections import Counter
+import input_helper
+import numpy as np
 
 def get_args():
     parser = argparse.ArgumentParser(description='Plot a line graph')
 
     plot_helper.add_plot_args(parser)
+    input_helper.add_input_args(parser)
 
     parser.add_argument("--delim",
                         default="\t",
@@ -21,34 +22,16 @@ def main():
 
     fig, ax = plt.subplots(figsize=(args.width, args.height))
 
-    Y=[]
-    for l in sys.stdin:
-        Y.append(float(l.strip()))
-    m = min(Y)
-    # compute pdf
-    n = len(Y)
-    s = sum(Y)
-    C = Counter(Y)
-    pdf = [(k, v / n) for k, v in C.items()]
-    pdf = sorted(pdf,key=lambda x: x[0])
-    # cdf
-    cdf = []
-    c=0
-    for x,p in pdf:
-        c+=p
-        cdf.append((x,c))
-    ## ccdf
-    ccdf=[]
+    Y = input_helper.load_column(args.input, args, args.delim)
+    # pdf and cdf over the distinct values
+    values, counts = np.unique(Y, return_counts=True)
+    cdf = np.cumsum(counts) / len(Y)
+    ## ccdf, starting from Pr(X>x) = 1 left of the smallest value
+    start = 0.00001 if args.xlog else values[0] - 1
+    X = np.concatenate([[start], values])
+    Y = np.concatenate([[1], 1 - cdf])
     if args.xlog:
-        ccdf.insert(0,(0.00001,1))
-    else:
-        ccdf.insert(0,(m-1,1))
-    for x,c in cdf:
-        ccdf.append((x,1-c))    
-    X = [x for x,y in ccdf]
-    Y = [y for x,y in ccdf]
-    if args.xlog:
-        X = [x+1 for x in X]
+        X = X + 1
         
     
     h = ax.plot(X,Y)
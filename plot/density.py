@@ -3,6 +3,7 @@ import argparse
 import os
 import numpy as np
 import matplotlib.pyplot as plt
+import input_helper
 
 
 p = argparse.ArgumentParser(
@@ -14,9 +15,11 @@ p.add_argument(
     required=True,
     help=(
         "Comma-separated list of files. "
-        "Each file must have a single numeric column (no header)."
+        "Each file must have a single numeric column (no header), "
+        "or be .npy/.npz/raw float (see --format)."
     ),
 )
+input_helper.add_input_args(p, input=False)
 p.add_argument(
     "-o",
     "--output",
@@ -72,16 +75,19 @@ p.add_argument(
     help="Show median line in violin plots."
 )
 
-def load_values(path):
-    data = np.loadtxt(path, dtype=float)
-    # allow both 1D and single-column 2D
-    if data.ndim == 2:
-        if data.shape[1] != 1:
-            raise ValueError(
-                f"File '{path}' must have exactly one column, got shape {data.shape}."
-            )
-        data = data[:, 0]
-    return np.asarray(data, dtype=float)
+def load_values(path, args):
+    data = input_helper.load_numeric(path, args)
+    # 1D inputs come back as a single column
+    if data.shape[1] != 1:
+        raise ValueError(
+            f"File '{path}' must have exactly one column, got shape {data.shape}."
+        )
+    values = np.asarray(data[:, 0], dtype=float)
+    # text fields that are not numbers parse as NaN; reject them, as np.loadtxt did
+    bad = np.isnan(values).sum()
+    if bad:
+        raise ValueError(f"File '{path}' has {bad} missing or non-numeric values.")
+    return values
 
 
 def main():
@@ -108,7 +114,7 @@ def main():
     labels = []
 
     for idx, path in enumerate(input_paths):
-        values = load_values(path)
+        values = load_values(path, args)
         datasets.append(values)
         label = names[idx] if names is not None else os.path.basename(path)
         labels.append(label)
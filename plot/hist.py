@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
-import sys
 import argparse
 import matplotlib.pyplot as plt
 import plot_helper
-import math
+import input_helper
+import numpy as np
 
 def get_args():
     parser = argparse.ArgumentParser(description='Plot a line graph')
 
     plot_helper.add_plot_args(parser)
+    input_helper.add_input_args(parser)
 
 
     parser.add_argument("--density",
@@ -46,16 +47,11 @@ def main():
 
     fig, ax = plt.subplots(figsize=(args.width, args.height))
 
-    Y=[]
-    for l in sys.stdin:
-        a = l.rstrip().split(args.delim)
-        if len(a) == 1:
-            if len(a[args.column]) != 0 :
-                Y.append(float(a[args.column]))
+    Y = input_helper.load_column(args.input, args, args.delim, args.column)
 
     if args.log_trans:
-        assert all(y >= 0 for y in Y), "All values must be non-negative for log transformation"
-        Y = [math.log(y+1,10) for y in Y]
+        assert (Y >= 0).all(), "All values must be non-negative for log transformation"
+        Y = np.log10(Y + 1)
 
     h = ax.hist(Y, \
                 bins=int(args.bins), \
@@ -0,0 +1,166 @@
+import io
+import os
+import struct
+import sys
+import zipfile
+import numpy as np
+import pandas as pd
+
+# raw streams are little-endian floats, as written by ndarray.tofile on x86
+BINARY = {'f32': '<f4', 'f64': '<f8'}
+EXTENSIONS = {'.npy': 'npy', '.npz': 'npz', '.f32': 'f32', '.f64': 'f64'}
+
+def read_buffer(stream=None):
+    '''All bytes of stream (stdin by default) in one read.'''
+    stream = stream if stream is not None else sys.stdin
+    return stream.buffer.read() if hasattr(stream, 'buffer') else stream.read()
+
+def csv_kwargs(delim, ncols):
+    # delim None splits on runs of whitespace, like str.split(); # starts a
+    # comment, as in np.loadtxt, so commented header lines are skipped
+    kwargs = {'sep': delim if delim else r'\s+', 'header': None, 'engine': 'c', 'skip_blank_lines': True, 'comment': '#'}
+    if ncols:
+        kwargs['names'] = range(ncols)
+    return kwargs
+
+def to_float(df):
+    '''Float array of a parsed frame; fields that are not numbers (NA, -, text) become NaN.'''
+    for c in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+    return df.to_numpy(dtype=float)
+
+def read_columns(stream=None, delim=None, ncols=None):
+    '''
+    Numbers on stream as a 2D float array, one row per non-empty line,
+    parsed in bulk by pandas' C reader rather than line by line in Python.
+    Lines are split on delim, or on whitespace if delim is None; text after
+    # is a comment; missing and non-numeric fields are NaN. ncols fixes the number of columns when
+    the first line is not the widest.
+    '''
+    buf = read_buffer(stream)
+    if not buf.strip():
+        return np.empty((0, ncols or 1))
+    return to_float(pd.read_csv(io.BytesIO(buf), **csv_kwargs(delim, ncols)))
+
+def iter_columns(stream=None, delim=None, ncols=None, chunksize=1000000):
+    '''As read_columns, but yields 2D arrays of up to chunksize lines, so memory stays bounded.'''
+    stream = stream if stream is not None else sys.stdin
+    stream = stream.buffer if hasattr(stream, 'buffer') else stream
+    try:
+        for chunk in pd.read_csv(stream, chunksize=chunksize, **csv_kwargs(delim, ncols)):
+            yield to_float(chunk)
+    except pd.errors.EmptyDataError:
+        return
+
+def read_rows(stream=None, delim=None):
+    '''
+    Numbers on stream as one 1D float array per non-empty line, for inputs
+    where each line is a series of its own length; # starts a comment. All fields are converted
+    in a single NumPy call and then split at the line lengths.
+    '''
+    lines = [line.split(b'#', 1)[0] for line in read_buffer(stream).splitlines()]
+    lines = [line for line in lines if line.strip()]
+    fields = [line.split(delim.encode()) if delim else line.split() for line in lines]
+    counts = np.array([len(f) for f in fields], dtype=np.int64)
+    tokens = np.array([t for f in fields for t in f], dtype=bytes)
+    try:
+        values = tokens.astype(float)
+    except ValueError:
+        values = pd.to_numeric(pd.Series(tokens).str.decode('utf-8'), errors='coerce').to_numpy(dtype=float)
+    return np.split(values, np.cumsum(counts)[:-1]) if len(counts) else []
+
+def add_input_args(parser, input=True):
+    if input:
+        parser.add_argument("-i",
+                            "--input",
+                            help="Input file (default: stdin)")
+
+    parser.add_argument("--format",
+                        choices=["auto", "text", "npy", "npz", "f32", "f64"],
+                        default="auto",
+                        help="Input format; auto uses the file extension (.npy, .npz, .f32, .f64) and text otherwise")
+
+    parser.add_argument("--npz_key",
+                        help="Array to read from an .npz file (default: the first)")
+
+    parser.add_argument("--raw_cols",
+                        type=int,
+                        default=1,
+                        help="Values per row in raw f32/f64 input (default: 1)")
+
+def input_format(path, args):
+    fmt = getattr(args, 'format', 'auto')
+    if fmt != 'auto':
+        return fmt
+    return EXTENSIONS.get(os.path.splitext(path or '')[1].lower(), 'text')
+
+def npz_member(path, key=None):
+    '''
+    One array of an .npz file. Members stored uncompressed (np.savez) are
+    memory-mapped in place inside the zip file; compressed ones
+    (np.savez_compressed) have to be read.
+    '''
+    with zipfile.ZipFile(path) as zf:
+        key = key or zf.namelist()[0][:-len('.npy')]
+        info = zf.getinfo(key + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(path) as f:
+            return f[key]
+    with open(path, 'rb') as f:
+        # the data follows the local file header, whose name and extra
+        # field lengths can differ from the central directory's
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = struct.unpack('<HH', f.read(4))
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+def load_numeric(path=None, args=None, delim=None, ncols=None):
+    '''
+    Numbers from path, or stdin if path is None, as a 2D array with one
+    row per value (or text line). .npy files and uncompressed .npz members
+    are memory-mapped and raw f32/f64 files are mapped with np.memmap, so
+    nothing is parsed or copied up front; text goes through read_columns.
+    '''
+    fmt = input_format(path, args)
+    if fmt == 'text':
+        if path is None:
+            return read_columns(sys.stdin, delim, ncols)
+        with open(path, 'rb') as f:
+            return read_columns(f, delim, ncols)
+    if fmt == 'npy':
+        data = np.load(path, mmap_mode='r') if path else np.load(io.BytesIO(read_buffer()))
+    elif fmt == 'npz':
+        if path:
+            data = npz_member(path, getattr(args, 'npz_key', None))
+        else:
+            with np.load(io.BytesIO(read_buffer())) as f:
+                data = f[getattr(args, 'npz_key', None) or f.files[0]]
+    else:
+        dtype = BINARY[fmt]
+        if path and os.path.getsize(path):
+            data = np.memmap(path, dtype=dtype, mode='r')
+        else:
+            data = np.frombuffer(read_buffer() if path is None else b'', dtype=dtype)
+        data = data.reshape(-1, getattr(args, 'raw_cols', 1))
+    return data.reshape(-1, 1) if data.ndim == 1 else data
+
+def load_column(path=None, args=None, delim=None, column=0):
+    '''One column of load_numeric as a 1D array, without its NaNs.'''
+    data = load_numeric(path, args, delim)
+    values = data[:, column] if data.shape[1] > column else np.empty(0)
+    return values[~np.isnan(values)]
+
+def iter_numeric(path=None, args=None, delim=None, ncols=None, chunksize=1000000):
+    '''load_numeric in blocks of chunksize rows; binary inputs are sliced from the mapped array.'''
+    if input_format(path, args) == 'text':
+        stream = open(path, 'rb') if path else sys.stdin
+        yield from iter_columns(stream, delim, ncols, chunksize)
+        return
+    data = load_numeric(path, args)
+    for i in range(0, len(data), chunksize):
+        yield data[i:i + chunksize]
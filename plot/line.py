@@ -3,6 +3,7 @@ import sys
 import argparse
 import matplotlib.pyplot as plt
 import plot_helper
+import input_helper
 
 def get_args():
     parser = argparse.ArgumentParser(description='Plot a line graph')
@@ -20,12 +21,8 @@ def main():
 
     fig, ax = plt.subplots(figsize=(args.width, args.height))
 
-    X = []
-    Y = []
-    for l in sys.stdin:
-        x,y = [float(x) for x in l.rstrip().split()]
-        X.append(x)
-        Y.append(y)
+    data = input_helper.read_columns(sys.stdin, ncols=2)
+    X, Y = data[:, 0], data[:, 1]
 
     ax.plot(X, Y, color=args.line_color)
 
@@ -4,6 +4,7 @@ import numpy as np
 import matplotlib
 import pylab
 import random
+import input_helper
 from optparse import OptionParser
 
 from matplotlib import rcParams
@@ -184,12 +185,12 @@ colors=options.colors.split(',')
 
 color_i = 0
 plts=[]
-lines = sys.stdin.readlines()
+rows = input_helper.read_rows(sys.stdin)
 
 if (options.X):
-    for i in range(len(lines))[::2]:
-        Y = [float(x) for x in lines[i].rstrip().split()]
-        X = [float(x) for x in lines[i+1].rstrip().split()]
+    for i in range(len(rows))[::2]:
+        Y = rows[i]
+        X = rows[i+1]
         p, = ax.plot(X,\
                      Y,\
                      options.line_style,\
@@ -199,8 +200,8 @@ if (options.X):
         plts.append(p)
         color_i = (color_i + 1) % len(colors)
 else:
-    for i in range(len(lines))[::1]:
-        Y = [float(x) for x in lines[i].rstrip().split()]
+    for i in range(len(rows))[::1]:
+        Y = rows[i]
         p, = ax.plot(range(len(Y)), \
                      Y,\
                      options.line_style,\
@@ -3,6 +3,7 @@ import argparse
 import os
 import numpy as np
 import matplotlib.pyplot as plt
+import input_helper
 from sklearn.metrics import roc_curve, roc_auc_score
 
 
@@ -15,9 +16,11 @@ p.add_argument(
     required=True,
     help=(
         "Comma-separated list of files. "
-        "Each file must have two columns: score,label (no header)."
+        "Each file must have two columns: score,label (no header), "
+        "or be a two-column .npy/.npz/raw float array (see --format)."
     ),
 )
+input_helper.add_input_args(p, input=False)
 p.add_argument(
     "-o",
     "--output",
@@ -62,13 +65,17 @@ p.add_argument(
 )
 
 
-def load_scores_and_labels(path, score_col=0, label_col=1):
-    # Let numpy treat any whitespace as delimiter (works for space/TSV)
-    data = np.loadtxt(path, dtype=float)
-    if data.ndim == 1:
+def load_scores_and_labels(path, args, score_col=0, label_col=1):
+    # text is split on any whitespace (works for space/TSV)
+    data = input_helper.load_numeric(path, args)
+    if data.shape[1] < 2:
         raise ValueError(f"File '{path}' must have at least two columns (score, label).")
-    y_score = data[:, score_col]
-    y_true = data[:, label_col]
+    y_score = np.asarray(data[:, score_col], dtype=float)
+    y_true = np.asarray(data[:, label_col], dtype=float)
+    # text fields that are not numbers parse as NaN; reject them, as np.loadtxt did
+    bad = (np.isnan(y_score) | np.isnan(y_true)).sum()
+    if bad:
+        raise ValueError(f"File '{path}' has {bad} rows with missing or non-numeric values.")
     return y_score, y_true
 
 
@@ -99,7 +106,7 @@ def main():
     curves = []
 
     for idx, score_path in enumerate(score_paths):
-        y_score, y_true = load_scores_and_labels(score_path, score_col=0, label_col=1)
+        y_score, y_true = load_scores_and_labels(score_path, args, score_col=0, label_col=1)
         y_score = np.asarray(y_score, dtype=float)
         y_true = np.asarray(y_true, dtype=float)
         if args.flip:
@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
-import sys
 import argparse
 import matplotlib.pyplot as plt
 import plot_helper
+import input_helper
 import numpy as np
 
 def get_args():
     parser = argparse.ArgumentParser(description='Plot a line graph')
 
     plot_helper.add_plot_args(parser)
+    input_helper.add_input_args(parser)
 
     parser.add_argument("-a",
                         "--alpha",
@@ -42,21 +43,11 @@ def get_args():
 def main():
     args = get_args()
 
-    X=[]
-    Y=[]
-    E=[]
-    for l in sys.stdin:
-        #a = l.rstrip().split(delim)
-        a = l.rstrip().split()
-        if len(a) == 1:
-            Y.append(float(a[0]))
-        if len(a) == 2:
-            X.append(float(a[0]))
-            Y.append(float(a[1]))
-        if len(a) == 3:
-            X.append(float(a[0]))
-            Y.append(float(a[1]))
-            E.append(float(a[2]))
+    # one column is Y, two are X Y, three are X Y size
+    data = input_helper.load_numeric(args.input, args)
+    X = data[:, 0] if data.shape[1] > 1 else []
+    Y = data[:, 1] if data.shape[1] > 1 else data[:, 0]
+    E = data[:, 2] if data.shape[1] > 2 else []
 
     fig, ax = plt.subplots(figsize=(args.width, args.height))
 
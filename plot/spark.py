@@ -4,6 +4,7 @@ import numpy as np
 import matplotlib
 import pylab
 import random
+import input_helper
 from optparse import OptionParser
 
 delim = '\t'
@@ -38,9 +39,7 @@ parser.add_option("--line_style",
 if not options.output_file:
     parser.error('Output file not given')
 
-Y=[]
-for l in sys.stdin:
-    Y.append([float(x) for x in l.split()])
+Y = input_helper.read_rows(sys.stdin)
 
 matplotlib.rcParams.update({'font.size': 12})
 fig = matplotlib.pyplot.figure(figsize=(5,10),dpi=300)
@@ -1,27 +1,237 @@
 #!/usr/bin/env python3
 
 import pandas as pd
+import numpy as np
 import argparse
 import os, sys
+import pickle
+import shutil
+import tempfile
+import time
+import multiprocessing
+import wrangle_helper
+
+class SpillPartitions:
+    '''
+    On-disk hash partitions for rows that arrive after the fingerprint set
+    is full. Rows are appended as pickled frames (keeping dtypes) with their
+    input row number and fingerprint. Each partition is then loaded on its
+    own, deduplicated on its key values and its survivors written back to
+    disk in input order, so memory holds one partition at a time; the
+    sorted survivor files are merged back into input order.
+    '''
+    def __init__(self, n, keys, temp_dir):
+        self.n = n
+        self.keys = keys
+        self.dir = tempfile.mkdtemp(prefix='drop_duplicates.', dir=temp_dir)
+        self.files = [open(os.path.join(self.dir, f'part{p}.pkl'), 'wb') for p in range(n)]
+        self.rows = 0
+
+    def add(self, df, h, rows):
+        df = df.assign(__row__=rows, __hash__=h)
+        part = h % np.uint64(self.n)
+        for p in np.unique(part):
+            pickle.dump(df[part == p], self.files[p])
+        self.rows += len(df)
+
+    def frames(self, path):
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def finish(self, out, chunksize):
+        for f in self.files:
+            f.close()
+        runs = []
+        for p in range(self.n):
+            path = os.path.join(self.dir, f'part{p}.pkl')
+            if not os.path.getsize(path):
+                os.remove(path)
+                continue
+            df = pd.concat(self.frames(path), ignore_index=True)
+            os.remove(path)
+            # rows were appended in input order, so the first of each key is the one
+            # to keep; keys are compared by value, so fingerprint collisions are kept apart
+            df = df[~df[self.keys].duplicated(keep='first')]
+            path = os.path.join(self.dir, f'sorted{p}.pkl')
+            with open(path, 'wb') as f:
+                for i in range(0, len(df), chunksize):
+                    pickle.dump(df.iloc[i:i + chunksize], f)
+            runs.append(SortedRun(self.frames(path)))
+
+        # write survivors window by window of input rows, in input order
+        written = 0
+        runs = [run for run in runs if run.df is not None]
+        while runs:
+            bound = min(int(run.df['__row__'].iloc[0]) for run in runs) + chunksize
+            window = pd.concat([part for run in runs for part in run.take(bound)]).sort_values('__row__')
+            window.drop(columns=['__row__', '__hash__']).to_csv(out, sep='\t', index=False, header=False)
+            written += len(window)
+            runs = [run for run in runs if run.df is not None]
+        shutil.rmtree(self.dir)
+        return written
+
+class SortedRun:
+    '''Cursor over frames of rows sorted by __row__, read one frame at a time.'''
+    def __init__(self, frames):
+        self.frames = frames
+        self.df = next(frames, None)
+
+    def take(self, bound):
+        '''Rows before input row bound, advancing past them.'''
+        parts = []
+        while self.df is not None:
+            end = np.searchsorted(self.df['__row__'].to_numpy(), bound)
+            parts.append(self.df.iloc[:end])
+            if end < len(self.df):
+                self.df = self.df.iloc[end:]
+                break
+            self.df = next(self.frames, None)
+        return parts
+
+def drop_duplicates_streaming(args, keys, read_kwargs):
+    '''
+    Streaming keep='first' deduplication. Each chunk's key columns are
+    hashed to 64-bit fingerprints; rows whose fingerprint was not seen are
+    written immediately and their fingerprints remembered. Once the set
+    holds --memory_budget MB, later unseen rows spill to hash partitions on
+    disk and are resolved after the last chunk. Within a chunk and within
+    a partition keys are compared by value; only the check against earlier
+    chunks goes by fingerprint, so a 64-bit hash collision with an earlier
+    key can drop a distinct row.
+    '''
+    # keys are read as text so the same key always hashes the same, whatever dtype a chunk infers
+    user_dtypes = wrangle_helper.parse_dtypes(args.dtypes)
+    read_kwargs.setdefault('dtype', {}).update({k: str for k in keys if k not in user_dtypes})
+    capacity = args.memory_budget * 2**20 // 8
+    seen = wrangle_helper.FingerprintSet()
+    spill = None
+    rows = written = 0
+    with open(args.output, 'w') as out:
+        for n, chunk in enumerate(pd.read_csv(args.input, sep='\t', chunksize=args.chunksize, **read_kwargs)):
+            h = pd.util.hash_pandas_object(chunk[keys], index=False).to_numpy()
+            new = ~chunk[keys].duplicated().to_numpy() & ~seen.contains(h)
+            if spill is None:
+                chunk[new].to_csv(out, sep='\t', index=False, header=n == 0)
+                written += new.sum()
+                seen.add(h[new])
+                if seen.size > capacity:
+                    spill = SpillPartitions(args.partitions, keys, args.temp_dir)
+                    print(f'{seen.size} keys exceed --memory_budget after {rows + len(chunk)} rows, spilling to {spill.dir}')
+            else:
+                spill.add(chunk[new], h[new], rows + np.nonzero(new)[0])
+            rows += len(chunk)
+        if rows == 0:
+            pd.read_csv(args.input, sep='\t', nrows=0, **read_kwargs).to_csv(out, sep='\t', index=False)
+        if spill is not None:
+            print(f'Resolving {spill.rows} spilled rows')
+            written += spill.finish(out, args.chunksize)
+    print(f'Read {rows} rows, wrote {written} rows')
+
+# the table and its partitions are handed to forked workers through this
+# global, so they are shared copy-on-write rather than pickled
+PARTITIONS = {}
+
+def group_sizes(df, keys):
+    '''Number of key groups of each size: index is the group size, values the group count.'''
+    sizes = df.groupby(keys, sort=False, dropna=False, observed=True).size()
+    return sizes.value_counts()
+
+def dedup_partition(i):
+    df, keys = PARTITIONS['df'], PARTITIONS['keys']
+    rows = PARTITIONS['parts'][i]
+    part = df.iloc[rows]
+    keep = rows[~part[keys].duplicated(keep='first').to_numpy()]
+    sizes = group_sizes(part, keys) if PARTITIONS['report'] else None
+    return keep, sizes
+
+def parallel_drop_duplicates(df, keys, args):
+    '''
+    Rows are split into --workers parts by a hash of their keys, so every
+    copy of a key lands in the same part, and each part is deduplicated in
+    its own process. Parts are kept as row positions in input order, so
+    sorting the surviving positions restores first-occurrence order.
+    '''
+    t = time.time()
+    h = pd.util.hash_pandas_object(df[keys], index=False).to_numpy()
+    parts = h % np.uint64(args.workers)
+    order = np.argsort(parts, kind='stable')
+    bounds = np.cumsum(np.bincount(parts, minlength=args.workers))[:-1]
+    PARTITIONS['parts'] = np.split(order, bounds)
+    PARTITIONS['df'], PARTITIONS['keys'], PARTITIONS['report'] = df, keys, args.report is not None
+    print(f'Partitioned into {args.workers} parts in {time.time() - t:.1f}s')
+
+    t = time.time()
+    with multiprocessing.get_context('fork').Pool(args.workers) as pool:
+        results = pool.map(dedup_partition, range(args.workers))
+    print(f'Deduplicated partitions in {time.time() - t:.1f}s')
+    PARTITIONS.clear()
+
+    keep = np.sort(np.concatenate([r[0] for r in results]))
+    sizes = pd.concat([r[1] for r in results]).groupby(level=0).sum() if args.report else None
+    return df.iloc[keep], sizes
+
+def write_report(sizes, path):
+    '''
+    Duplicate-group size distribution: one row per group size with the
+    number of key groups of that size and the rows they hold.
+    '''
+    sizes = sizes.sort_index()
+    report = pd.DataFrame({'group_size': sizes.index, 'groups': sizes.values, 'rows': sizes.index * sizes.values})
+    report.to_csv(path, sep='\t', index=False)
+    dup = report[report['group_size'] > 1]
+    print(f'{report["groups"].sum()} distinct keys in {report["rows"].sum()} rows; '
+          f'{dup["groups"].sum()} duplicated keys in {dup["rows"].sum()} rows, '
+          f'{dup["rows"].sum() - dup["groups"].sum()} rows dropped; largest group {report["group_size"].max()} rows')
+
 parser = argparse.ArgumentParser(description='Drop duplicate rows based arguments')
 parser.add_argument('-i', '--input', type=str, required=True, help='Input file with potential duplicate rows')
 parser.add_argument('-o', '--output', type=str, required=True, help='Output file with duplicates dropped')
 parser.add_argument('-c', '--cols', type=str, required=True, help='Comma-separated list of columns to consider for identifying duplicates')
 parser.add_argument('--complement', action='store_true', help='If set, use complement of specified columns to identify duplicates')
+parser.add_argument('--chunksize', type=int, default=None, help='Stream the input in chunks of this many rows, remembering only 64-bit fingerprints of the keys seen')
+parser.add_argument('--memory_budget', type=int, default=1024, help='With --chunksize, MB of key fingerprints to hold before spilling rows to disk (default: 1024)')
+parser.add_argument('--partitions', type=int, default=64, help='With --chunksize, number of on-disk hash partitions for spilled rows (default: 64)')
+parser.add_argument('--temp_dir', type=str, default=None, help='Directory for spilled partitions (default: system temp)')
+parser.add_argument('--workers', type=int, default=1, help='Hash partition rows by key and deduplicate the partitions in this many processes')
+parser.add_argument('--report', type=str, default=None, help='Write the duplicate-group size distribution (group_size, groups, rows) to this file')
+wrangle_helper.add_read_args(parser)
+wrangle_helper.add_cache_args(parser)
 args = parser.parse_args()
 
-df = pd.read_csv(args.input, sep='\t')
+# --cols are 1-based numbers of columns in the file; with --usecols the
+# complement is taken over the columns that are read
+header = pd.read_csv(args.input, sep='\t', nrows=0).columns.tolist()
 cols = set(args.cols.split(','))
 cols = {int(c) for c in cols}
+read_cols = wrangle_helper.parse_usecols(args.usecols, header) if args.usecols else header
 if args.complement:
-    all_cols = set(range(1,len(df.columns)+1)) # 1-based indexing
+    all_cols = {header.index(c)+1 for c in read_cols} # 1-based indexing
     cols = all_cols - cols
 # convert to 0-based indexing
-cols = [c-1 for c in cols]
+cols = sorted(c-1 for c in cols)
+keys = [header[c] for c in cols]
 print(f'Dropping duplicates based on columns: {cols}, complement={args.complement}')
 
-# duplicated returns a boolean series, True for duplicates
-# all except the first occurrence are marked as True
-df = df[~df.iloc[:, cols].duplicated(keep='first')]
+read_kwargs = wrangle_helper.read_kwargs(args.input, args, keys, usecols=read_cols if args.usecols else None)
+if args.chunksize:
+    assert args.workers == 1 and args.report is None, '--chunksize cannot be combined with --workers or --report'
+    drop_duplicates_streaming(args, keys, read_kwargs)
+    sys.exit(0)
+
+df = wrangle_helper.read_csv_cached(args.input, args, sep='\t', **read_kwargs)
+
+if args.workers > 1:
+    df, sizes = parallel_drop_duplicates(df, keys, args)
+else:
+    sizes = group_sizes(df, keys) if args.report else None
+    # duplicated returns a boolean series, True for duplicates
+    # all except the first occurrence are marked as True
+    df = df[~df[keys].duplicated(keep='first')]
+if args.report:
+    write_report(sizes, args.report)
 
 df.to_csv(args.output, sep='\t', index=False)
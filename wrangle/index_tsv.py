@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import gzip
+import io
+import time
+import numpy as np
+import pandas as pd
+import sort_tsv
+import wrangle_helper
+
+def index_path(path):
+    return path + '.idx'
+
+class BlockIndex:
+    '''
+    Reader for a block-compressed TSV written by this script: the header
+    and then blocks of whole lines, each an independent gzip member (so the
+    file is also a plain gzip file for zcat), with a sidecar .idx holding
+    every block's offset, compressed size, row count and first and last
+    keys. Keys are compared with the typed ordering of sort_tsv.py.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(index_path(path)) as f:
+            self.spec = f.readline().rstrip('\n').split('\t')[1]
+            header_size = int(f.readline().rstrip('\n').split('\t')[1])
+            self.blocks = pd.read_csv(f, sep='\t', dtype=str, keep_default_na=False)
+        with open(path, 'rb') as f:
+            self.columns = gzip.decompress(f.read(header_size)).decode().rstrip('\n').split('\t')
+        self.keys = sort_tsv.parse_keys(self.spec)
+        self.key_names = [self.columns[col] for col, _ in self.keys]
+        self.offsets = self.blocks['offset'].astype(np.int64).to_numpy()
+        self.sizes = self.blocks['size'].astype(np.int64).to_numpy()
+        key = sort_tsv.text_key(self.keys)
+        self.first = [key(k) for k in self.blocks[[f'first_{n}' for n in self.key_names]].itertuples(index=False)]
+        self.last = [key(k) for k in self.blocks[[f'last_{n}' for n in self.key_names]].itertuples(index=False)]
+        self.key = key
+
+    def find(self, values):
+        '''Blocks that can hold rows with these key values (text, in index key order).'''
+        k = self.key(values)
+        # blocks with first <= k <= last; both lists are sorted
+        return range(bisect.bisect_left(self.last, k), bisect.bisect_right(self.first, k))
+
+    def read(self, blocks, **kwargs):
+        '''The rows of the given blocks as one DataFrame, parsed together so dtypes agree across blocks.'''
+        data = []
+        with open(self.path, 'rb') as f:
+            for b in sorted(blocks):
+                f.seek(self.offsets[b])
+                data.append(gzip.decompress(f.read(self.sizes[b])))
+        return pd.read_csv(io.BytesIO(b''.join(data)), sep='\t', header=None, names=self.columns, **kwargs)
+
+def build(args):
+    '''
+    Compresses a TSV sorted by -c into blocks of about --block_kb and
+    writes the block index. Sort order is checked while building, a
+    buffer of lines at a time with the same vectorized ordering sort_tsv.py
+    uses, since lookups rely on it.
+    '''
+    keys = sort_tsv.parse_keys(args.cols)
+    line_key = sort_tsv.line_key(keys)
+    block_bytes = args.block_kb * 1024
+    with open(args.input, 'rb') as f:
+        header = f.readline()
+    names = header.decode().rstrip('\n').split('\t')
+    key_names = [names[col] for col, _ in keys]
+
+    index = []
+    prev = None
+    rows = 0
+    with open(args.output, 'wb') as out:
+        out.write(gzip.compress(header, compresslevel=args.compresslevel))
+        header_size = out.tell()
+        for buf in wrangle_helper.line_blocks(args.input, args.buffer_mb * 2**20, len(header)):
+            lines = buf.split(b'\n')[:-1]
+            df = sort_tsv.key_frame(buf, keys)
+            order = sort_tsv.run_order(df, keys, False)
+            unsorted = np.nonzero(order != np.arange(len(order)))[0]
+            assert len(unsorted) == 0, f'{args.input} is not sorted by {args.cols} near line {rows + unsorted[0] + 2}; sort it with sort_tsv.py'
+            assert prev is None or line_key(prev) <= line_key(lines[0].decode()), f'{args.input} is not sorted by {args.cols} at line {rows + 2}'
+
+            # cut after the first line that ends at or past each multiple of block_bytes
+            ends = np.cumsum([len(line) + 1 for line in lines])
+            cuts = np.searchsorted(ends, np.arange(block_bytes, ends[-1] + block_bytes, block_bytes)) + 1
+            cuts = np.unique(np.minimum(cuts, len(lines)))
+            start = 0
+            for end in cuts:
+                lo = ends[start - 1] if start else 0
+                block = gzip.compress(buf[lo:ends[end - 1]], compresslevel=args.compresslevel)
+                index.append([out.tell(), len(block), end - start] + df.iloc[start].tolist() + df.iloc[end - 1].tolist())
+                out.write(block)
+                start = end
+            rows += len(lines)
+            prev = lines[-1].decode()
+
+    columns = ['offset', 'size', 'rows'] + [f'first_{n}' for n in key_names] + [f'last_{n}' for n in key_names]
+    with open(index_path(args.output), 'w') as f:
+        f.write(f'#cols\t{args.cols}\n#header_size\t{header_size}\n')
+        pd.DataFrame(index, columns=columns).to_csv(f, sep='\t', index=False)
+    return rows, len(index)
+
+def main():
+    parser = argparse.ArgumentParser(description='Block-compress a sorted TSV and index it by key for random access, e.g. by join.py --indexed_right')
+    parser.add_argument('-i', '--input', type=str, required=True, help='Input TSV file with a header, sorted by the key columns (see sort_tsv.py)')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Output block-compressed file (e.g. ref.tsv.gz); the index is written next to it as <output>.idx')
+    parser.add_argument('-c', '--cols', type=str, required=True, help='Key columns the input is sorted by, as for sort_tsv.py, e.g. "1:natural,2:int"')
+    parser.add_argument('--block_kb', type=int, default=64, help='Uncompressed size of a block in KB; smaller blocks make lookups read less (default: 64)')
+    parser.add_argument('--compresslevel', type=int, default=6, help='gzip compression level (default: 6)')
+    parser.add_argument('--buffer_mb', type=int, default=64, help='MB of input read and checked at a time (default: 64)')
+    args = parser.parse_args()
+
+    t = time.time()
+    rows, blocks = build(args)
+    print(f'Indexed {rows} rows in {blocks} blocks into {args.output} in {time.time() - t:.1f}s')
+
+if __name__ == "__main__":
+    main()
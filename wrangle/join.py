@@ -1,61 +1,708 @@
 #!/usr/bin/env python3
 import pandas as pd
+import numpy as np
 import os
 import sys
 import argparse
 import time
+import shutil
+import multiprocessing
+import wrangle_helper
+import index_tsv
+import sort_tsv
 
-parser = argparse.ArgumentParser(description='Join two files')
-parser.add_argument('-x', '--input1', type=str, required=True, help='Input file 1')
-parser.add_argument('-y', '--input2', type=str, required=True, help='Input file 2')
-parser.add_argument('-o', '--output', type=str, required=True, help='Output file')
-parser.add_argument('-t', '--type', type=str, default='left', help='Join type (inner, outer, left, right)')
-parser.add_argument('-k', '--keys', type=str, required=True, help='Join keys (comma separated)')
-parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
-parser.add_argument('-i', '--index', action='store_true', help='Tables have index column')
-parser.add_argument('-c', '--complement', action='store_true', help='Complement the join, i.e., keep only rows that are not in the other table')
-parser.add_argument('-d', '--drop_duplicates', action='store_true', help='Drop duplicate rows based on keys after join')
-args  = parser.parse_args()
-
-assert os.path.exists(args.input1), f'Input file 1 {args.input1} does not exist'
-assert os.path.exists(args.input2), f'Input file 2 {args.input2} does not exist'
-args.keys = args.keys.split(',')
-
-print(f'Joining files {args.input1} and {args.input2} on keys {args.keys} with join type {args.type}')
-if not args.index:
-    df_x = pd.read_csv(args.input1, sep='\t', index_col=None)
-    df_y = pd.read_csv(args.input2, sep='\t', index_col=None)
-if args.index:
-    df_x = pd.read_csv(args.input1, sep='\t', index_col=0)
-    df_y = pd.read_csv(args.input2, sep='\t', index_col=0)
-if args.verbose:
-    print('df_x columns:', df_x.columns.tolist())
-    print('df_x:', df_x.head(),sep='\n')
-    print('df_y columns:', df_y.columns.tolist())
-    print('df_y:', df_y.head(), sep='\n')
-if args.complement:
-    assert args.type == 'left', 'Complementing the join is only supported for left join'
-    print('Complementing the join, i.e., keeping only rows that are in x and not in y')
-
-assert all([key in df_x.columns for key in args.keys]), f'Keys {args.keys} not found in input file 1 {args.input1}'
-assert all([key in df_y.columns for key in args.keys]), f'Keys {args.keys} not found in input file 2 {args.input2}'
-
-if args.type == 'left':
-    if not args.complement:
+def get_args():
+    parser = argparse.ArgumentParser(description='Join two files')
+    parser.add_argument('-x', '--input1', type=str, required=True, help='Input file 1')
+    parser.add_argument('-y', '--input2', type=str, nargs='+', required=True, help='Input file 2, or several files to join onto file 1 in one pass. A file can be followed by :col,... or :col=key,... to join it on other (or differently named) columns than --keys')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Output file')
+    parser.add_argument('-t', '--type', type=str, default='left', help='Join type (left, outer, semi, anti; inner with --interval). semi/anti keep the rows of file 1 whose keys are (not) in file 2')
+    parser.add_argument('-k', '--keys', type=str, default=None, help='Join keys (comma separated), required unless --interval is given')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+    parser.add_argument('-i', '--index', action='store_true', help='Tables have index column')
+    parser.add_argument('-c', '--complement', action='store_true', help='Complement the join, i.e., keep only rows that are not in the other table (same as -t anti)')
+    parser.add_argument('-d', '--drop_duplicates', action='store_true', help='Drop duplicate rows based on keys after join')
+    parser.add_argument('--chunksize', type=int, default=None, help='Stream the larger file in chunks of this many rows and hash join each chunk against the smaller file')
+    wrangle_helper.add_read_args(parser)
+    wrangle_helper.add_cache_args(parser)
+    parser.add_argument('--workers', type=int, default=1, help='Hash partition both files by key and join the partitions in this many processes')
+    parser.add_argument('--keep_order', action='store_true', help='With --workers, write rows in file 1 order (right-only outer rows last) instead of partition by partition')
+    parser.add_argument('--interval', type=str, default=None, help='Overlap join on chrom,start,end columns (half-open, BED style) present in both files')
+    parser.add_argument('--min_overlap', type=int, default=1, help='With --interval, minimum overlap in bases (default: 1)')
+    parser.add_argument('--indexed_right', action='store_true', help='File 2 is block compressed and indexed by index_tsv.py; only the blocks holding keys of file 1 are read (left, semi and anti joins)')
+    parser.add_argument('--presorted', action='store_true', help='Both files are sorted by the keys; stream them through a merge join (reads --chunksize rows at a time, default 100000)')
+    parser.add_argument('--key_types', type=str, default=None, help='With --presorted, the order the files are sorted in, one type per key as for sort_tsv.py: str, int, float or natural, e.g. "natural,int" (default: int or float for numeric keys, str otherwise)')
+    args  = parser.parse_args()
+
+    assert os.path.exists(args.input1), f'Input file 1 {args.input1} does not exist'
+    assert args.keys or args.interval, 'Join keys (-k) are required unless --interval is given'
+    if args.interval:
+        args.interval = args.interval.split(',')
+        assert len(args.interval) == 3, '--interval takes three columns: chrom,start,end'
+    args.keys = args.keys.split(',') if args.keys else args.interval
+    args.right = [parse_right(spec, args.keys) for spec in args.input2]
+    for path, _, _ in args.right:
+        assert os.path.exists(path), f'Input file 2 {path} does not exist'
+    # a single file joined on --keys goes through the two-file engines
+    args.multiway = len(args.right) > 1 or args.right[0][1] != args.keys or args.right[0][2] != args.keys
+    args.input2 = args.right[0][0] if not args.multiway else ','.join(path for path, _, _ in args.right)
+    return args
+
+def parse_right(spec, keys):
+    '''
+    "file" joins on keys; "file:a,b" joins on columns a,b of both tables;
+    "file:gene_id=gene" joins column gene_id of file on column gene of file 1.
+    Returns (path, right keys, left keys).
+    '''
+    if ':' not in spec or os.path.exists(spec):
+        return spec, keys, keys
+    path, mapping = spec.rsplit(':', 1)
+    pairs = [m.split('=') if '=' in m else (m, m) for m in mapping.split(',')]
+    return path, [r for r, _ in pairs], [l for _, l in pairs]
+
+def read_table(path, args, keys=None, **kwargs):
+    # with --usecols the index column is simply not read; it is never written out
+    index_col = 0 if args.index and not args.usecols else None
+    kwargs.update(wrangle_helper.read_kwargs(path, args, keys or args.keys))
+    if 'chunksize' in kwargs or 'nrows' in kwargs:
+        # streamed reads always parse the file
+        return pd.read_csv(path, sep='\t', index_col=index_col, **kwargs)
+    return wrangle_helper.read_csv_cached(path, args, sep='\t', index_col=index_col, **kwargs)
+
+def check_keys(df, keys, path):
+    assert all([key in df.columns for key in keys]), f'Keys {keys} not found in input file {path}'
+
+def read_keys(path, args, keys=None):
+    '''Only the key columns, for semi and anti joins.'''
+    keys = keys or args.keys
+    return wrangle_helper.read_csv_cached(path, args, sep='\t', **wrangle_helper.read_kwargs(path, args, keys, usecols=keys))
+
+def semi_anti_mask(df_x, key_set, args, keys=None):
+    '''True for the rows of df_x kept by a semi or anti join against the unique keys in key_set.'''
+    in_y = key_index(df_x, keys or args.keys).isin(key_set)
+    return in_y if args.type == 'semi' else ~in_y
+
+def merge_frames(df_x, df_y, args):
+    if args.type in ('semi', 'anti'):
+        df_merged = df_x[semi_anti_mask(df_x, key_index(df_y, args.keys).unique(), args)]
+    elif args.type == 'left':
         df_merged = pd.merge(df_x, df_y, on=args.keys, how='left')
+    elif args.type == 'outer':
+        df_merged = pd.merge(df_x, df_y, on=args.keys, how='outer')
+    if args.drop_duplicates:
+        df_merged.drop_duplicates(subset=args.keys, inplace=True)
+    return df_merged
+
+def merge_in_memory(args):
+    df_x = read_table(args.input1, args)
+    if args.type in ('semi', 'anti'):
+        df_y = read_keys(args.input2, args)
+    else:
+        df_y = read_table(args.input2, args)
+    if args.verbose:
+        print('df_x columns:', df_x.columns.tolist())
+        print('df_x:', df_x.head(),sep='\n')
+        print('df_y columns:', df_y.columns.tolist())
+        print('df_y:', df_y.head(), sep='\n')
+
+    check_keys(df_x, args.keys, args.input1)
+    check_keys(df_y, args.keys, args.input2)
+
+    merge_frames(df_x, df_y, args).to_csv(args.output, sep='\t', index=False)
+
+def multiway_join(args):
+    '''
+    Joins every -y file onto file 1 in one process, without writing or
+    re-parsing intermediate tables. Files are joined smallest first (by
+    size on disk) and each is released before the next is read; the output
+    columns are file 1 followed by each file's columns in command line
+    order. Non-key columns whose names clash with file 1 or another -y file
+    get the file name as suffix, e.g. score_annot; files whose names give
+    the same suffix also get their position among the -y files, e.g.
+    score_annot1 and score_annot2.
+    '''
+    left_keys = list(dict.fromkeys(args.keys + [k for _, _, lkeys in args.right for k in lkeys]))
+    df = read_table(args.input1, args, keys=left_keys)
+    check_keys(df, left_keys, args.input1)
+    base_cols = df.columns.tolist()
+
+    # output names of every file's value columns, from the headers alone
+    headers = [pd.read_csv(path, sep='\t', nrows=0, index_col=0 if args.index else None).columns.tolist() for path, _, _ in args.right]
+    value_cols = [[c for c in cols if c not in rkeys] for cols, (_, rkeys, _) in zip(headers, args.right)]
+    seen = pd.Series([c for cols in value_cols for c in cols]).value_counts()
+    stems = [os.path.basename(path).split('.')[0] for path, _, _ in args.right]
+    stems = [f'{stem}{i + 1}' if stems.count(stem) > 1 else stem for i, stem in enumerate(stems)]
+    renames = []
+    for cols, stem in zip(value_cols, stems):
+        renames.append({c: f'{c}_{stem}' for c in cols if c in base_cols or seen[c] > 1})
+
+    order = sorted(range(len(args.right)), key=lambda i: os.path.getsize(args.right[i][0]))
+    for i in order:
+        path, rkeys, lkeys = args.right[i]
+        t = time.time()
+        if args.type in ('semi', 'anti'):
+            df_y = read_keys(path, args, rkeys)
+            df = df[semi_anti_mask(df, key_index(df_y, rkeys).unique(), args, lkeys)]
+        else:
+            df_y = read_table(path, args, keys=rkeys)
+            check_keys(df_y, rkeys, path)
+            df_y = df_y.rename(columns=dict(zip(rkeys, lkeys))).rename(columns=renames[i])
+            df = pd.merge(df, df_y, on=lkeys, how=args.type)
+        del df_y
+        print(f'Joined {path} on {lkeys} in {time.time() - t:.1f}s: {len(df)} rows')
+
+    if args.type not in ('semi', 'anti'):
+        out_cols = base_cols + [renames[i].get(c, c) for i in range(len(args.right)) for c in value_cols[i]]
+        missing = [c for c in out_cols if c not in df.columns]
+        # pandas suffixes clashing names with _x/_y instead of failing
+        assert not missing, f'Output columns {missing} were renamed by a name clash; rename the columns in the input files'
+        df = df[out_cols]
+    if args.drop_duplicates:
+        df.drop_duplicates(subset=args.keys, inplace=True)
+    df.to_csv(args.output, sep='\t', index=False)
+
+# partitions are handed to forked workers through this global, so they
+# are shared copy-on-write instead of pickled
+PARTITIONS = {}
+
+def hash_partition(df_x, df_y, keys, n):
+    '''
+    Splits both frames into n parts so that all rows with a key land in the
+    same part. Keys are factorized over both frames together, so keys that
+    are equal but parsed with different dtypes (1 and 1.0) still agree.
+    '''
+    ix, iy = key_index(df_x, keys), key_index(df_y, keys)
+    codes, _ = pd.factorize(ix.append(iy), use_na_sentinel=False)
+    parts = codes % n
+    split = []
+    for df, p in ((df_x, parts[:len(df_x)]), (df_y, parts[len(df_x):])):
+        order = np.argsort(p, kind='stable')
+        bounds = np.cumsum(np.bincount(p, minlength=n))[:-1]
+        split.append([df.iloc[rows] for rows in np.split(order, bounds)])
+    return split
+
+def join_partition(i):
+    args = PARTITIONS['args']
+    df_merged = merge_frames(PARTITIONS['x'][i], PARTITIONS['y'][i], args)
+    if args.keep_order:
+        return df_merged
+    path = f'{args.output}.part{i}'
+    df_merged.to_csv(path, sep='\t', index=False, header=False)
+    return path
+
+def parallel_join(args):
+    '''
+    Hash partitioned join: both files are split by key into --workers
+    parts and each pair of parts is merged in its own process. Parts are
+    written to temporary files and concatenated into the output, or, with
+    --keep_order, gathered and sorted back into file 1 order.
+    '''
+    df_x = read_table(args.input1, args)
+    df_y = read_keys(args.input2, args) if args.type in ('semi', 'anti') else read_table(args.input2, args)
+    check_keys(df_x, args.keys, args.input1)
+    check_keys(df_y, args.keys, args.input2)
+    if args.keep_order:
+        df_x = df_x.assign(__row__=np.arange(len(df_x)))
+
+    t = time.time()
+    PARTITIONS['x'], PARTITIONS['y'] = hash_partition(df_x, df_y, args.keys, args.workers)
+    PARTITIONS['args'] = args
+    header = merge_frames(df_x.iloc[:0], df_y.iloc[:0], args)
+    del df_x, df_y
+    print(f'Partitioned into {args.workers} parts in {time.time() - t:.1f}s')
+
+    t = time.time()
+    with multiprocessing.get_context('fork').Pool(args.workers) as pool:
+        results = pool.map(join_partition, range(args.workers))
+    print(f'Joined partitions in {time.time() - t:.1f}s')
+
+    if args.keep_order:
+        df_merged = pd.concat(results, ignore_index=True)
+        df_merged = df_merged.sort_values('__row__', kind='stable', na_position='last').drop(columns='__row__')
+        df_merged.to_csv(args.output, sep='\t', index=False)
+        return
+    header.to_csv(args.output, sep='\t', index=False)
+    with open(args.output, 'ab') as out:
+        for path in results:
+            with open(path, 'rb') as part:
+                shutil.copyfileobj(part, out)
+            os.remove(path)
+
+def overlap_pairs(x, y, cols, min_overlap, block=1000000):
+    '''
+    (x row, y row) pairs of intervals that overlap by at least min_overlap,
+    in x order and then by y start. Chromosomes are folded into a single
+    coordinate axis by offsetting each one past the end of the previous,
+    and y intervals are grouped into classes of similar length (powers of
+    two). Within a class sorted by start, the candidates for an x interval
+    [s, e) are the y starts in (s - longest, e), found with two binary
+    searches; candidates are then checked exactly. Everything is vectorized
+    over blocks of x rows taken in start order.
+    '''
+    chrom, start, end = cols
+    codes, _ = pd.factorize(key_index(x, [chrom]).append(key_index(y, [chrom])))
+    cx, cy = codes[:len(x)].astype(np.int64), codes[len(x):].astype(np.int64)
+    xs, xe = x[start].to_numpy(np.int64), x[end].to_numpy(np.int64)
+    ys, ye = y[start].to_numpy(np.int64), y[end].to_numpy(np.int64)
+    span = 2 * max(xe.max(initial=0), ye.max(initial=0)) + 2
+    xs, xe = xs + cx * span, xe + cx * span
+    ys, ye = ys + cy * span, ye + cy * span
+
+    y_len = ye - ys
+    y_class = np.floor(np.log2(np.maximum(y_len, 1))).astype(np.int64)
+    classes = []
+    for c in np.unique(y_class):
+        rows = np.nonzero(y_class == c)[0]
+        rows = rows[np.argsort(ys[rows], kind='stable')]
+        classes.append((rows, ys[rows], y_len[rows].max()))
+
+    # binary searches are much faster for sorted needles
+    x_order = np.argsort(xs, kind='stable')
+    x_rows, y_rows = [], []
+    for b in range(0, len(x), block):
+        block_rows = x_order[b:b + block]
+        bs, be = xs[block_rows], xe[block_rows]
+        for rows, starts, longest in classes:
+            lo = np.searchsorted(starts, bs - longest, 'right')
+            hi = np.searchsorted(starts, be - min_overlap + 1, 'left')
+            n = np.maximum(hi - lo, 0)
+            xi = np.repeat(block_rows, n)
+            within = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            yi = rows[np.repeat(lo, n) + within]
+            overlap = np.minimum(xe[xi], ye[yi]) - np.maximum(xs[xi], ys[yi])
+            keep = overlap >= min_overlap
+            x_rows.append(xi[keep])
+            y_rows.append(yi[keep])
+    xi = np.concatenate(x_rows) if x_rows else np.zeros(0, dtype=np.int64)
+    yi = np.concatenate(y_rows) if y_rows else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((yi, ys[yi], xi))
+    return xi[order], yi[order]
+
+def key_text(s):
+    '''
+    Key values as the text they were read from, as index_tsv.py and
+    sort_tsv.py see them: whole numbers in a float column (an integer key
+    with missing values) are written without .0, and missing values are
+    empty.
+    '''
+    text = s.astype(str)
+    if pd.api.types.is_float_dtype(s):
+        whole = np.isfinite(s) & (s == np.floor(s))
+        text[whole] = s[whole].astype('int64').astype(str)
+    text[s.isna()] = ''
+    return text
+
+def indexed_join(args):
+    '''
+    Join against a reference built by index_tsv.py. The keys of file 1 are
+    looked up in the block index and only the blocks that can hold them
+    are decompressed and parsed; the merge itself is the in-memory one.
+    '''
+    index = index_tsv.BlockIndex(args.input2)
+    assert set(index.key_names) <= set(args.keys), f'{args.input2} is indexed by {index.key_names}, which must be among the join keys {args.keys}'
+    df_x = read_table(args.input1, args)
+    check_keys(df_x, args.keys, args.input1)
+
+    t = time.time()
+    queries = pd.DataFrame({k: key_text(df_x[k]) for k in index.key_names}).drop_duplicates()
+    blocks = set()
+    for values in queries.itertuples(index=False, name=None):
+        blocks.update(index.find(values))
+    usecols = None
+    if args.type in ('semi', 'anti'):
+        usecols = args.keys
+    elif args.usecols:
+        wanted = set(wrangle_helper.parse_usecols(args.usecols, index.columns)) | set(args.keys)
+        usecols = [c for c in index.columns if c in wanted]
+    dtypes = {c: t for c, t in wrangle_helper.parse_dtypes(args.dtypes).items() if c in index.columns}
+    df_y = index.read(blocks, usecols=usecols, dtype=dtypes or None)
+    if args.index and usecols is None:
+        df_y = df_y.set_index(df_y.columns[0])
+    print(f'Read {len(blocks)} of {len(index.offsets)} blocks ({len(df_y)} rows) for {len(queries)} keys in {time.time() - t:.2f}s')
+    check_keys(df_y, args.keys, args.input2)
+
+    merge_frames(df_x, df_y, args).to_csv(args.output, sep='\t', index=False)
+
+def interval_join(args):
+    '''
+    Overlap join of two interval tables on --interval chrom,start,end.
+    inner and left write one row per overlapping pair (left keeps x rows
+    without overlaps, padded with NaN); semi and anti write the x rows that
+    do or do not overlap anything in y.
+    '''
+    chrom = args.interval[0]
+    df_x = read_table(args.input1, args)
+    df_y = read_table(args.input2, args)
+    check_keys(df_x, args.interval, args.input1)
+    check_keys(df_y, args.interval, args.input2)
+
+    t = time.time()
+    xi, yi = overlap_pairs(df_x, df_y, args.interval, args.min_overlap)
+    print(f'Found {len(xi)} overlaps between {len(df_x)} and {len(df_y)} intervals in {time.time() - t:.1f}s')
+
+    hits = np.bincount(xi, minlength=len(df_x))
+    x_names, y_names = output_columns(df_x.columns, df_y.columns, [chrom])
+    if args.type in ('semi', 'anti'):
+        df_merged = df_x[hits > 0] if args.type == 'semi' else df_x[hits == 0]
+        x_names = {}
     else:
-        df_merged = pd.merge(df_x, df_y, on=args.keys, how='left', indicator=True)
-        df_merged = df_merged[df_merged['_merge'] == 'left_only']
-        df_merged.drop(columns=['_merge'], inplace=True)
-        # drop columns with suffix _y
-        df_merged = df_merged.loc[:, ~df_merged.columns.str.endswith('_y')]
-        # rename columns with suffix _x to original names
-        df_merged.columns = [col.replace('_x', '') if col.endswith('_x') else col for col in df_merged.columns]
-elif args.type == 'outer':
-    df_merged = pd.merge(df_x, df_y, on=args.keys, how='outer')
-else: 
-    raise ValueError(f'Join type "{args.type}" is not supported. Please use left join.')
-if args.drop_duplicates:
-    df_merged.drop_duplicates(subset=args.keys, inplace=True)
-df_merged.to_csv(args.output, sep='\t', index=False)
-print(f'{args.type} join completed. Output written to {args.output}')
+        if args.type == 'left':
+            # x rows without overlaps, merged back into x order
+            missing = np.nonzero(hits == 0)[0]
+            order = np.argsort(np.concatenate([xi, missing]), kind='stable')
+            xi = np.concatenate([xi, missing])[order]
+            yi = np.concatenate([yi, np.full(len(missing), -1)])[order]
+        df_x = df_x.reset_index(drop=True).rename(columns=x_names)
+        df_y = df_y.reset_index(drop=True).rename(columns=y_names)
+        y_vals = [c for c in df_y.columns if c != chrom]
+        nullable(df_y, y_vals)
+        df_merged = pd.concat([df_x.iloc[xi].reset_index(drop=True), df_y[y_vals].reindex(yi).reset_index(drop=True)], axis=1)
+    if args.drop_duplicates:
+        # one row per x interval
+        df_merged = df_merged.drop_duplicates(subset=[x_names.get(c, c) for c in args.interval])
+    df_merged.to_csv(args.output, sep='\t', index=False)
+
+def key_index(df, keys):
+    if len(keys) == 1:
+        return pd.Index(df[keys[0]])
+    return pd.MultiIndex.from_frame(df[keys])
+
+def build_hash_table(df, keys):
+    '''
+    Hash the key columns of df once. Returns the unique keys (a pandas
+    Index whose hash engine is reused for every probe) and the row
+    positions of df grouped by key: rows with key i are
+    order[starts[i]:starts[i]+counts[i]].
+    '''
+    codes, uniques = pd.factorize(key_index(df, keys), use_na_sentinel=False)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(uniques))
+    starts = np.cumsum(counts) - counts
+    return uniques, order, starts, counts
+
+def probe_hash_table(table, df, keys, keep_unmatched):
+    '''
+    Returns (probe_rows, build_rows) row position pairs for every match of
+    df against the hash table, in probe order. If keep_unmatched, probe rows
+    without a match are kept in place with build row -1.
+    '''
+    uniques, order, starts, counts = table
+    codes = uniques.get_indexer(key_index(df, keys))
+    matched = codes >= 0
+    n = np.where(matched, counts[codes], 0)
+    if keep_unmatched:
+        n[~matched] = 1
+    probe_rows = np.repeat(np.arange(len(df)), n)
+    # offset of each output row within its key group
+    within = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    build_rows = order[np.repeat(starts[codes.clip(0)], n) + within] if len(order) else np.zeros(len(probe_rows), dtype=np.int64)
+    build_rows[~np.repeat(matched, n)] = -1
+    return probe_rows, build_rows
+
+def output_columns(x_cols, y_cols, keys):
+    '''Column renames that reproduce the _x/_y suffixes of pd.merge.'''
+    overlap = (set(x_cols) & set(y_cols)) - set(keys)
+    x_names = {c: c + '_x' for c in overlap}
+    y_names = {c: c + '_y' for c in overlap}
+    return x_names, y_names
+
+def nullable(df, cols):
+    '''Integer and bool columns become nullable so NaN padding does not change their formatting between chunks.'''
+    for c in cols:
+        if pd.api.types.is_integer_dtype(df[c]):
+            df[c] = df[c].astype('Int64')
+        elif pd.api.types.is_bool_dtype(df[c]):
+            df[c] = df[c].astype('boolean')
+    return df
+
+class ChunkWriter:
+    '''
+    Appends joined chunks to the output. With drop_duplicates, keys already
+    written are remembered as 64-bit fingerprints (8 bytes per distinct key,
+    checked in bulk) rather than Python tuples; keys that collide with an
+    earlier key's fingerprint are dropped as duplicates.
+    '''
+    def __init__(self, path, keys, drop_duplicates):
+        self.path = path
+        self.keys = keys
+        self.drop_duplicates = drop_duplicates
+        self.seen = wrangle_helper.FingerprintSet()
+        self.header = True
+        self.rows = 0
+
+    def write(self, df):
+        if self.drop_duplicates:
+            df = df[~df.duplicated(subset=self.keys)]
+            h = pd.util.hash_pandas_object(df[self.keys], index=False).to_numpy()
+            new = ~self.seen.contains(h)
+            self.seen.add(h[new])
+            df = df[new]
+        df.to_csv(self.path, sep='\t', index=False, header=self.header, mode='w' if self.header else 'a')
+        self.header = False
+        self.rows += len(df)
+
+def chunked_hash_join(args):
+    '''
+    Out-of-core hash join. The smaller file (by size on disk) is loaded
+    and hashed once; the larger one is streamed with read_csv(chunksize=...)
+    and each chunk is probed and written out before the next is read, so
+    peak memory is the build table plus one chunk.
+
+    When the left file (-x) is streamed, output rows keep its order as in
+    the in-memory join. When it is the build side, matched rows follow the
+    order of the right file and unmatched left rows are written at the end.
+    '''
+    keys = args.keys
+    build_left = os.path.getsize(args.input1) <= os.path.getsize(args.input2)
+    build_path, probe_path = (args.input1, args.input2) if build_left else (args.input2, args.input1)
+    print(f'Building hash table from {build_path}, streaming {probe_path} in chunks of {args.chunksize} rows')
+
+    t = time.time()
+    build = read_table(build_path, args).reset_index(drop=True)
+    check_keys(build, keys, build_path)
+    table = build_hash_table(build, keys)
+    print(f'Hashed {len(build)} rows ({len(table[0])} distinct keys) in {time.time() - t:.1f}s')
+    if args.verbose:
+        print('build columns:', build.columns.tolist())
+        print('build:', build.head(), sep='\n')
+
+    chunks = read_table(probe_path, args, chunksize=args.chunksize)
+    first = next(chunks, None)
+    if first is None:
+        first = read_table(probe_path, args, nrows=0)
+    check_keys(first, keys, probe_path)
+
+    x_cols = (build if build_left else first).columns.tolist()
+    y_cols = (first if build_left else build).columns.tolist()
+    x_names, y_names = output_columns(x_cols, y_cols, keys)
+    y_vals = [y_names.get(c, c) for c in y_cols if c not in keys]
+    out_cols = [x_names.get(c, c) for c in x_cols] + y_vals
+
+    def prepare(df, is_left):
+        df = df.reset_index(drop=True).rename(columns=x_names if is_left else y_names)
+        # sides that can be padded with NaN in the output
+        if args.type == 'outer' or not is_left:
+            nullable(df, [c for c in df.columns if c not in keys])
+        return df
+
+    def assemble(x, x_rows, y, y_rows):
+        '''Output rows from row positions into x and y; -1 pads with NaN and keys come from whichever side matched.'''
+        x_part = x.reindex(x_rows).reset_index(drop=True)
+        y_part = y.reindex(y_rows).reset_index(drop=True)
+        out = pd.concat([x_part, y_part[y_vals]], axis=1)
+        y_only = x_rows < 0
+        if y_only.any():
+            # keys are taken from the rows as read, not from the NaN-padded
+            # reindex, so integer keys stay integers as in pd.merge
+            at = np.concatenate([np.nonzero(~y_only)[0], np.nonzero(y_only)[0]])
+            for k in keys:
+                # categorical keys of different chunks concatenate as plain values
+                key = pd.concat([x[k].iloc[x_rows[~y_only]], y[k].iloc[y_rows[y_only]]], ignore_index=True)
+                key.index = at
+                out[k] = key.sort_index()
+        return out[out_cols]
+
+    build = prepare(build, build_left)
+    x_empty = build.iloc[:0] if build_left else prepare(first.iloc[:0], True)
+    y_empty = prepare(first.iloc[:0], False) if build_left else build.iloc[:0]
+    build_hit = np.zeros(len(build), dtype=bool)
+    writer = ChunkWriter(args.output, keys, args.drop_duplicates)
+    # left (or outer) rows of the streamed file are kept inline
+    keep_unmatched = not build_left or args.type == 'outer'
+
+    n_chunks = 0
+    for chunk in chain_chunks(first, chunks):
+        probe = prepare(chunk, not build_left)
+        probe_rows, build_rows = probe_hash_table(table, probe, keys, keep_unmatched)
+        build_hit[build_rows[build_rows >= 0]] = True
+        if build_left:
+            writer.write(assemble(build, build_rows, probe, probe_rows))
+        else:
+            writer.write(assemble(probe, probe_rows, build, build_rows))
+        n_chunks += 1
+        if args.verbose:
+            print(f'Chunk {n_chunks}: {len(chunk)} rows, {writer.rows} rows written')
+
+    # build rows that never matched
+    rest = np.nonzero(~build_hit)[0]
+    if build_left:
+        writer.write(assemble(build, rest, y_empty, np.full(len(rest), -1)))
+    elif args.type == 'outer':
+        writer.write(assemble(x_empty, np.full(len(rest), -1), build, rest))
+    print(f'Streamed {n_chunks} chunks, wrote {writer.rows} rows')
+
+def chunked_semi_anti(args):
+    '''
+    Streams file 1 in chunks and keeps the rows whose keys are (semi) or
+    are not (anti) in file 2. Only the key columns of file 2 are read, and
+    only its distinct keys are kept in memory.
+    '''
+    t = time.time()
+    key_set = key_index(read_keys(args.input2, args), args.keys).unique()
+    print(f'Read {len(key_set)} distinct keys from {args.input2} in {time.time() - t:.1f}s')
+    writer = ChunkWriter(args.output, args.keys, args.drop_duplicates)
+    n_chunks = 0
+    for chunk in read_table(args.input1, args, chunksize=args.chunksize):
+        if n_chunks == 0:
+            check_keys(chunk, args.keys, args.input1)
+        writer.write(chunk[semi_anti_mask(chunk, key_set, args)])
+        n_chunks += 1
+        if args.verbose:
+            print(f'Chunk {n_chunks}: {len(chunk)} rows, {writer.rows} rows written')
+    if n_chunks == 0:
+        writer.write(read_table(args.input1, args, nrows=0))
+    print(f'Streamed {n_chunks} chunks, wrote {writer.rows} rows')
+
+def chain_chunks(first, chunks):
+    if len(first):
+        yield first
+    yield from chunks
+
+def fmt_key(key):
+    return ', '.join(str(k) for k in key)
+
+SORT_HINT = '; if it was sorted by sort_tsv.py with typed keys, pass the same types as --key_types'
+
+class SortedReader:
+    '''
+    Cursor over a file sorted by keys. Chunks are appended to buf as they
+    are read and checked to continue the sort order of everything before.
+    Keys are compared in the typed order of sort_tsv.py (sort_keys, as
+    parsed by its parse_keys), through the key components of
+    sort_tsv.sort_columns, so a file sorted there with natural chromosome
+    order can be merged.
+    '''
+    def __init__(self, path, args, nullable_cols, sort_keys):
+        self.path = path
+        self.keys = args.keys
+        self.nullable_cols = nullable_cols
+        self.sort_keys = sort_keys
+        self.chunks = read_table(path, args, chunksize=args.chunksize or 100000)
+        self.buf = None
+        self.order = None
+        self.last_read = None
+        self.rows_read = 0
+        self.done = False
+        self.fill()
+        if self.buf is None:
+            self.buf = read_table(path, args, nrows=0)
+            self.order = sort_tsv.sort_columns(pd.DataFrame({i: pd.Series(dtype=str) for i in range(len(self.keys))}), sort_keys)
+        check_keys(self.buf, self.keys, path)
+
+    def fill(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.done = True
+            return
+        chunk = chunk.reset_index(drop=True)
+        if self.nullable_cols:
+            nullable(chunk, [c for c in chunk.columns if c not in self.keys])
+        text = pd.DataFrame({i: key_text(chunk[k]) for i, k in enumerate(self.keys)})
+        order = sort_tsv.sort_columns(text, self.sort_keys)
+        idx = pd.MultiIndex.from_frame(order)
+        if not idx.is_monotonic_increasing:
+            bad = np.nonzero([a > b for a, b in zip(idx[:-1], idx[1:])])[0][0] + 1
+            raise ValueError(f'{self.path} is not sorted by keys {self.keys}: row {self.rows_read + bad + 1} ({fmt_key(text.iloc[bad])}) comes after ({fmt_key(text.iloc[bad - 1])}){SORT_HINT}')
+        if len(chunk) and self.last_read is not None and idx[0] < self.last_read[0]:
+            raise ValueError(f'{self.path} is not sorted by keys {self.keys}: row {self.rows_read + 1} ({fmt_key(text.iloc[0])}) comes after ({fmt_key(self.last_read[1])}){SORT_HINT}')
+        if len(chunk):
+            self.last_read = (idx[-1], text.iloc[-1])
+        self.rows_read += len(chunk)
+        self.buf = chunk if self.buf is None else pd.concat([self.buf, chunk], ignore_index=True)
+        self.order = order if self.order is None else pd.concat([self.order, order], ignore_index=True)
+
+    def last(self):
+        return tuple(self.order.iloc[-1])
+
+    def take(self, frontier):
+        '''Remove and return the buffered rows with keys before frontier (all rows if frontier is None).'''
+        if frontier is None:
+            n = len(self.buf)
+        else:
+            n = pd.MultiIndex.from_frame(self.order).get_slice_bound(frontier, 'left')
+        ready, self.buf = self.buf.iloc[:n], self.buf.iloc[n:]
+        self.order = self.order.iloc[n:]
+        return ready
+
+def key_types(args):
+    '''sort_tsv.py key types of --keys: --key_types, or inferred from the dtypes of the first rows of file 1 (file 2 if file 1 is empty).'''
+    if args.key_types:
+        types = args.key_types.split(',')
+        assert len(types) == len(args.keys), f'--key_types needs one type per key, got {types} for {args.keys}'
+        return types
+    for path in (args.input1, args.input2):
+        sample = read_table(path, args, nrows=1000)
+        check_keys(sample, args.keys, path)
+        if len(sample):
+            break
+    return ['int' if pd.api.types.is_integer_dtype(sample[k]) else 'float' if pd.api.types.is_numeric_dtype(sample[k]) else 'str'
+            for k in args.keys]
+
+def merge_join_presorted(args):
+    '''
+    Streaming merge join of two files sorted by the keys. Each side is a
+    cursor over chunks; after every read, rows with keys below the smaller
+    of the two last keys read are complete on both sides, so they are
+    merged and written. Memory holds about one chunk per side (plus the
+    rows of a single key if it spans chunks).
+    '''
+    # each chunk would get its own categories, which neither concatenate
+    # nor compare against keys from other chunks, so keys stay plain strings
+    args.no_categorical_keys = True
+    types = key_types(args)
+    sort_keys = sort_tsv.parse_keys(','.join(f'{i + 1}:{t}' for i, t in enumerate(types)))
+    left = SortedReader(args.input1, args, args.type == 'outer', sort_keys)
+    right = SortedReader(args.input2, args, True, sort_keys)
+    # batches cover disjoint key ranges, so duplicates never span two writes
+    writer = ChunkWriter(args.output, args.keys, False)
+    while True:
+        for side in (left, right):
+            while not side.done and len(side.buf) == 0:
+                side.fill()
+        open_sides = [side for side in (left, right) if not side.done]
+        frontier = min(side.last() for side in open_sides) if open_sides else None
+        df_merged = merge_frames(left.take(frontier), right.take(frontier), args)
+        writer.write(df_merged)
+        if frontier is None:
+            break
+        for side in open_sides:
+            if side.last() == frontier:
+                side.fill()
+    print(f'Merged {left.rows_read} and {right.rows_read} sorted rows, wrote {writer.rows} rows')
+
+def main():
+    args = get_args()
+    print(f'Joining files {args.input1} and {args.input2} on keys {args.keys} with join type {args.type}')
+    if args.complement:
+        assert args.type == 'left', 'Complementing the join is only supported for left join'
+        print('Complementing the join, i.e., keeping only rows that are in x and not in y')
+        args.type = 'anti'
+    if args.type not in ('left', 'outer', 'semi', 'anti') and not (args.interval and args.type == 'inner'):
+        raise ValueError(f'Join type "{args.type}" is not supported. Please use left, outer, semi or anti join.')
+
+    assert args.presorted or not args.key_types, '--key_types sets the sort order of --presorted files'
+    if args.interval:
+        assert not (args.multiway or args.presorted or args.chunksize or args.workers > 1), '--interval joins two files in memory'
+        assert args.type in ('inner', 'left', 'semi', 'anti'), '--interval supports inner, left, semi and anti joins'
+        interval_join(args)
+    elif args.indexed_right:
+        assert not (args.multiway or args.presorted or args.chunksize or args.workers > 1), '--indexed_right looks up file 1 keys in a single indexed file 2'
+        assert args.type in ('left', 'semi', 'anti'), '--indexed_right supports left, semi and anti joins'
+        indexed_join(args)
+    elif args.multiway:
+        assert not args.presorted and not args.chunksize, '--presorted and --chunksize join a single file 2 on --keys'
+        multiway_join(args)
+    elif args.presorted:
+        merge_join_presorted(args)
+    elif args.workers > 1:
+        parallel_join(args)
+    elif args.chunksize and args.type in ('semi', 'anti'):
+        chunked_semi_anti(args)
+    elif args.chunksize:
+        chunked_hash_join(args)
+    else:
+        merge_in_memory(args)
+    print(f'{args.type} join completed. Output written to {args.output}')
+
+if __name__ == '__main__':
+    main()
@@ -1,65 +1,272 @@
 #!/usr/bin/env python3
 """
 General-purpose file joiner using DuckDB
-Performs LEFT JOIN on specified key columns
+Performs LEFT (or INNER, FULL, SEMI, ANTI, ASOF) JOIN on specified key columns
 """
 
 import argparse
 import duckdb
+import glob
+import hashlib
 import sys
 import os
+import time
+
+def input_files(path):
+    """Files behind an input: a single file, a glob pattern, or every file under a (hive-partitioned) directory."""
+    if os.path.isdir(path):
+        return sorted(f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True) if os.path.isfile(f))
+    if glob.has_magic(path):
+        return sorted(glob.glob(path, recursive=True))
+    return [path]
+
+def scan(path, delimiter, header):
+    """
+    Table function reading an input. Globs and directories are read by
+    DuckDB in parallel, matching columns by name across shards; a
+    directory also exposes key=value path components as columns. A single
+    file is read plainly: union_by_name makes DuckDB plan some queries
+    (ASOF joins in particular) far slower, and has nothing to unify there.
+    """
+    files = input_files(path)
+    if not files:
+        raise FileNotFoundError(f"No files match {path}")
+    hive = os.path.isdir(path)
+    if hive:
+        ext = os.path.splitext(files[0])[1]
+        path = os.path.join(path, '**', f'*{ext}')
+    options = f", hive_partitioning={str(hive).lower()}, union_by_name=true" if hive or len(files) > 1 else ""
+    if all(f.endswith('.parquet') for f in files):
+        return f"read_parquet('{path}'{options})"
+    return f"read_csv_auto('{path}', delim='{delimiter}', header={str(header).lower()}{options})"
+
+def ingest(con, path, delimiter, header):
+    """
+    Name of a native table holding path, loading it only if it is new or
+    changed. The _sources catalog records the size and mtime each table
+    was loaded from, so later runs against the same --db skip sniffing
+    and parsing the file.
+    """
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS _sources (
+            path VARCHAR, delim VARCHAR, header BOOLEAN,
+            size BIGINT, mtime DOUBLE, table_name VARCHAR,
+            PRIMARY KEY (path, delim, header)
+        )
+    """)
+    path = os.path.abspath(path)
+    # a sharded input changes if any shard is added, removed or rewritten
+    stats = [os.stat(f) for f in input_files(path)]
+    size, mtime = sum(st.st_size for st in stats), max(st.st_mtime for st in stats)
+    table = 't_' + hashlib.sha1(f'{path}\t{delimiter}\t{header}'.encode()).hexdigest()[:16]
+    row = con.execute(
+        "SELECT size, mtime FROM _sources WHERE path = ? AND delim = ? AND header = ?",
+        [path, delimiter, header]
+    ).fetchone()
+    if row == (size, mtime):
+        return table
+
+    print(f"Ingesting {path} into {table}")
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT * FROM {scan(path, delimiter, header)}
+    """)
+    con.execute(
+        "INSERT OR REPLACE INTO _sources VALUES (?, ?, ?, ?, ?, ?)",
+        [path, delimiter, header, size, mtime, table]
+    )
+    return table
+
+def source(con, path, args):
+    """FROM-clause expression for a file: its ingested table with --db, otherwise read directly."""
+    header = not args.no_header
+    if args.db:
+        return ingest(con, path, args.delimiter, header)
+    return scan(path, args.delimiter, header)
+
+def copy_options(output, args):
+    """COPY options: delimited text by default, compressed Parquet for .parquet outputs or --partition-by."""
+    if args.partition_by or output.endswith('.parquet'):
+        options = f"FORMAT PARQUET, COMPRESSION {args.compression}"
+        if args.partition_by:
+            # output is a directory of col=value/ subdirectories
+            partition = ', '.join([f'"{col.strip()}"' for col in args.partition_by.split(',')])
+            options += f", PARTITION_BY ({partition}), OVERWRITE_OR_IGNORE true"
+        return options
+    return f"FORMAT CSV, DELIMITER '{args.delimiter}', HEADER {str(not args.no_header).lower()}"
+
+def configure(con, args):
+    """Resource limits for the connection; unset options keep DuckDB's defaults."""
+    if args.threads:
+        con.execute(f"SET threads = {args.threads}")
+    if args.memory_limit:
+        con.execute(f"SET memory_limit = '{args.memory_limit}'")
+    if args.temp_dir:
+        # operators that exceed memory_limit spill here
+        con.execute(f"SET temp_directory = '{args.temp_dir}'")
+
+def asof_select(left, right, keys, args):
+    """
+    Nearest-key join: for each left row, the right row in the same key
+    group whose --asof-key is closest behind (backward), ahead (forward) or
+    on either side (nearest). Uses DuckDB ASOF joins, which sort rather
+    than compare all pairs. Left rows without a match within
+    --max-distance keep NULL right columns. l and r are numbered and
+    materialized once, and each left row carries the number of its one
+    matched right row, so right rows that tie on --asof-key never repeat a
+    left row.
+    """
+    pos = f'"{args.asof_key}"'
+    groups = [f'l."{key}" = r."{key}"' for key in keys]
+    exclude_clause = ', '.join([f'"{key}"' for key in keys] + [pos, '_rrow'])
+
+    def asof(op):
+        on = " AND ".join(groups + [f"l.{pos} {op} r.{pos}"])
+        return f"SELECT l._row, r._rrow, r.{pos} AS _match FROM l ASOF LEFT JOIN r ON {on}"
+
+    if args.direction == 'backward':
+        match = asof('>=')
+    elif args.direction == 'forward':
+        match = asof('<=')
+    else:
+        # ties go to the upstream match
+        match = f"""
+        SELECT l._row, CASE
+            WHEN b._match IS NULL THEN f._rrow
+            WHEN f._match IS NULL THEN b._rrow
+            WHEN l.{pos} - b._match <= f._match - l.{pos} THEN b._rrow
+            ELSE f._rrow END AS _rrow
+        FROM l JOIN ({asof('>=')}) b USING (_row) JOIN ({asof('<=')}) f USING (_row)
+        """
+    within = f" AND abs(l.{pos} - r.{pos}) <= {args.max_distance}" if args.max_distance is not None else ""
+
+    return f"""
+        WITH l AS MATERIALIZED (SELECT *, row_number() OVER () AS _row FROM {left}),
+             r AS MATERIALIZED (SELECT *, row_number() OVER () AS _rrow FROM {right}),
+             m AS ({match})
+        SELECT l.* EXCLUDE (_row), r.* EXCLUDE ({exclude_clause}), r.{pos} AS "{args.asof_key}_match"
+        FROM l JOIN m USING (_row)
+        LEFT JOIN r ON r._rrow = m._rrow{within}
+        ORDER BY l._row
+    """
+
+def run_join(con, left, right, output, keys, args):
+    # Build JOIN condition
+    join_conditions = [f'l."{key}" = r."{key}"' for key in keys]
+    join_clause = " AND ".join(join_conditions)
+
+    # Build EXCLUDE clause with double quotes to handle reserved keywords like 'left'
+    exclude_clause = ', '.join([f'"{key}"' for key in keys])
+
+    if args.type in ('semi', 'anti'):
+        select = "l.*"
+    elif args.type == 'full':
+        # keys of right-only rows come from the right table
+        replace_clause = ', '.join([f'COALESCE(l."{key}", r."{key}") AS "{key}"' for key in keys])
+        select = f"l.* REPLACE ({replace_clause}), r.* EXCLUDE ({exclude_clause})"
+    else:
+        select = f"l.*, r.* EXCLUDE ({exclude_clause})"
+    join = {'inner': 'INNER JOIN', 'left': 'LEFT JOIN', 'full': 'FULL OUTER JOIN',
+            'semi': 'SEMI JOIN', 'anti': 'ANTI JOIN', 'asof': None}[args.type]
+
+    if args.type == 'asof':
+        join = f"ASOF JOIN on {args.asof_key}, {args.direction}"
+        query = f"""
+    COPY (
+        {asof_select(source(con, left, args), source(con, right, args), keys, args)}
+    ) TO '{output}' ({copy_options(output, args)})
+    """
+    else:
+        query = f"""
+    COPY (
+        SELECT {select}
+        FROM {source(con, left, args)} AS l
+        {join} {source(con, right, args)} AS r
+        ON {join_clause}
+    ) TO '{output}' ({copy_options(output, args)})
+    """
+
+    print(f"Joining on keys: {', '.join(keys)} ({join})")
+    t = time.time()
+    if args.explain_analyze:
+        # runs the COPY and returns the plan annotated with per-operator timings
+        plan = con.execute(f"EXPLAIN ANALYZE {query}").fetchall()
+        print(plan[0][1])
+    else:
+        con.execute(query)
+    print(f"Wrote {output} in {time.time() - t:.1f}s")
+
+def read_batch(path):
+    """Join specs from a tab-separated file with columns left, right, output, keys (header optional)."""
+    specs = []
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if not line.strip() or line.startswith('#') or fields[:4] == ['left', 'right', 'output', 'keys']:
+                continue
+            left, right, output, keys = fields[:4]
+            specs.append((left, right, output, [key.strip() for key in keys.split(',')]))
+    return specs
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Join two TSV/CSV files using DuckDB LEFT JOIN"
+        description="Join two TSV/CSV files using DuckDB"
     )
-    
+
     # File arguments
-    parser.add_argument('-l', '--left', required=True, help='Left table file')
-    parser.add_argument('-r', '--right', required=True, help='Right table file') 
-    parser.add_argument('-o', '--output', required=True, help='Output file path')
-    
+    parser.add_argument('-l', '--left', help='Left table file, glob pattern (quoted, e.g. "shards/*.tsv") or hive-partitioned directory')
+    parser.add_argument('-r', '--right', help='Right table file, glob pattern or hive-partitioned directory')
+    parser.add_argument('-o', '--output', help='Output file path (.parquet writes Parquet)')
+
     # Join key arguments
-    parser.add_argument('-k', '--keys', required=True, 
+    parser.add_argument('-k', '--keys',
                        help='Comma-separated key columns (e.g., "col1,col2")')
-    
+
     # Optional arguments
     parser.add_argument('--delimiter', default='\t', help='File delimiter (default: tab)')
     parser.add_argument('--no-header', action='store_true', help='Files have no headers')
-    
+    parser.add_argument('--db', help='Persistent DuckDB database; each input file is ingested once and reused until it changes')
+    parser.add_argument('--batch', help='Run every join in this TSV of left, right, output, keys on one connection (instead of -l/-r/-o/-k)')
+    parser.add_argument('--partition-by', help='Write compressed Parquet partitioned by these comma-separated columns into the -o directory')
+    parser.add_argument('--compression', default='zstd', help='Parquet compression codec (default: zstd)')
+    parser.add_argument('-t', '--type', default='left', choices=['inner', 'left', 'full', 'semi', 'anti', 'asof'], help='Join type (default: left)')
+
+    # ASOF join arguments
+    parser.add_argument('--asof-key', help='Numeric column matched to the nearest value within each -k group (required for -t asof)')
+    parser.add_argument('--direction', default='backward', choices=['backward', 'forward', 'nearest'], help='ASOF match direction: right key <= left key (backward), >= (forward) or closest (default: backward)')
+    parser.add_argument('--max-distance', type=float, help='Drop ASOF matches farther than this from the left key')
+
+    # Execution arguments
+    parser.add_argument('--threads', type=int, help='Number of DuckDB threads (default: all cores)')
+    parser.add_argument('--memory-limit', help='DuckDB memory limit, e.g. "16GB"; larger joins spill to --temp-dir')
+    parser.add_argument('--temp-dir', help='Directory for spilled intermediate data')
+    parser.add_argument('--explain-analyze', action='store_true', help='Print the profiled query plan with per-operator timings')
+
     args = parser.parse_args()
-    
-    # Parse join keys
-    keys = [key.strip() for key in args.keys.split(',')]
-    
-    # Build JOIN condition
-    join_conditions = [f"l.{key} = r.{key}" for key in keys]
-    join_clause = " AND ".join(join_conditions)
-    
-    header = not args.no_header
-    
+
+    if args.batch:
+        specs = read_batch(args.batch)
+    else:
+        if not (args.left and args.right and args.output and args.keys):
+            parser.error('-l, -r, -o and -k are required unless --batch is given')
+        # Parse join keys
+        keys = [key.strip() for key in args.keys.split(',')]
+        specs = [(args.left, args.right, args.output, keys)]
+    if args.type == 'asof' and not args.asof_key:
+        parser.error('--asof-key is required for -t asof')
+
     try:
-        con = duckdb.connect()
-        
-        # Build EXCLUDE clause with double quotes to handle reserved keywords like 'left'
-        exclude_clause = ', '.join([f'"{key}"' for key in keys])
-        
-        query = f"""
-        COPY (
-            SELECT l.*, r.* EXCLUDE ({exclude_clause})
-            FROM read_csv_auto('{args.left}', delim='{args.delimiter}', header={str(header).lower()}) AS l
-            LEFT JOIN read_csv_auto('{args.right}', delim='{args.delimiter}', header={str(header).lower()}) AS r
-            ON {join_clause}
-        ) TO '{args.output}' (FORMAT CSV, DELIMITER '{args.delimiter}', HEADER {str(header).lower()})
-        """
-        
-        print(f"Joining on keys: {', '.join(keys)}")
-        con.execute(query)
+        con = duckdb.connect(args.db) if args.db else duckdb.connect()
+        configure(con, args)
+
+        for left, right, output, keys in specs:
+            run_join(con, left, right, output, keys, args)
+        con.close()
         print("Join completed!")
-        
+
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import argparse
+import operator
+import re
+import sys
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pyarrow.types as pt
+
+OPS = {'==': operator.eq, '!=': operator.ne, '<=': operator.le, '>=': operator.ge, '<': operator.lt, '>': operator.gt}
+
+def parse_filter(spec, schema):
+    '''
+    (column, op, value) for a filter like "pos>=1000" or "chrom==chr1",
+    with the value converted to the column's type.
+    '''
+    m = re.match(r'^\s*(.+?)\s*(==|!=|<=|>=|<|>)\s*(.*?)\s*$', spec)
+    assert m, f'Cannot parse filter {spec!r}, expected e.g. "col>=10"'
+    col, op, value = m.groups()
+    assert col in schema.names, f'{col} not in {schema.names}'
+    t = schema.field(col).type
+    if pt.is_boolean(t):
+        value = value.lower() in ('true', '1')
+    elif pt.is_integer(t):
+        value = int(value)
+    elif pt.is_floating(t):
+        value = float(value)
+    return col, op, value
+
+def may_match(stats, op, value):
+    '''False only if a row group's min/max rule out any row satisfying the filter.'''
+    if stats is None or not stats.has_min_max:
+        return True
+    lo, hi = stats.min, stats.max
+    if op == '==':
+        return lo <= value <= hi
+    if op == '!=':
+        return not (lo == hi == value)
+    if op == '<':
+        return lo < value
+    if op == '<=':
+        return lo <= value
+    if op == '>':
+        return hi > value
+    return hi >= value
+
+def row_groups(pf, filters):
+    '''Row groups of pf whose column statistics admit every filter.'''
+    names = pf.schema_arrow.names
+    groups = []
+    for i in range(pf.metadata.num_row_groups):
+        rg = pf.metadata.row_group(i)
+        if all(may_match(rg.column(names.index(col)).statistics, op, value) for col, op, value in filters):
+            groups.append(i)
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description="Query Parquet files, reading only the columns and row groups a query needs.")
+    parser.add_argument('-i', '--input', nargs='+', required=True, help='Parquet file(s), e.g. written by tsv2parquet.py')
+    parser.add_argument('-c', '--columns', default=None, help='Comma-separated columns to output (default: all)')
+    parser.add_argument('-w', '--where', action='append', default=[], help='Filter such as "pos>=1000" or "chrom==chr1"; may be repeated (all must hold)')
+    parser.add_argument('-o', '--output', default=None, help='Output TSV file (default: stdout)')
+    args = parser.parse_args()
+
+    t = time.time()
+    out = open(args.output, 'w') if args.output else sys.stdout
+    header = True
+    total = read = rows = 0
+    for path in args.input:
+        pf = pq.ParquetFile(path)
+        schema = pf.schema_arrow
+        filters = [parse_filter(f, schema) for f in args.where]
+        columns = [c.strip() for c in args.columns.split(',')] if args.columns else schema.names
+        # filter columns are read too, then dropped after filtering
+        needed = columns + [col for col, _, _ in filters if col not in columns]
+        groups = row_groups(pf, filters)
+        total += pf.metadata.num_row_groups
+        read += len(groups)
+        for i in groups:
+            table = pf.read_row_group(i, columns=needed)
+            mask = None
+            for col, op, value in filters:
+                m = OPS[op](pc.field(col), value)
+                mask = m if mask is None else mask & m
+            if mask is not None:
+                table = table.filter(mask)
+            df = table.select(columns).to_pandas()
+            df.to_csv(out, sep='\t', index=False, header=header)
+            header = False
+            rows += len(df)
+    if header:
+        # nothing matched: still write the column names
+        pa.schema([schema.field(c) for c in columns]).empty_table().to_pandas().to_csv(out, sep='\t', index=False)
+    if args.output:
+        out.close()
+    print(f'Read {read} of {total} row groups, {rows} rows matched in {time.time() - t:.1f}s', file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import gzip
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+import wrangle_helper
+
+class ShardWriter:
+    '''
+    Buffers lines per shard in memory and appends them to the shard files
+    once --buffer_mb is reached. A file is opened only while it is being
+    appended to, so any number of shards can be written without running
+    out of file descriptors. With gzip each flush appends a gzip member;
+    concatenated members are a valid gzip file for zcat, gzip and pandas.
+    '''
+    def __init__(self, paths, header, args):
+        self.paths = paths
+        self.header = header
+        self.compresslevel = args.compresslevel if args.gzip else None
+        self.limit = args.buffer_mb * 2**20
+        self.buffers = [[] for _ in paths]
+        self.buffered = 0
+        self.rows = np.zeros(len(paths), dtype=np.int64)
+        self.raw_bytes = np.zeros(len(paths), dtype=np.int64)
+        self.started = np.zeros(len(paths), dtype=bool)
+
+    def add(self, shard, data, rows):
+        self.buffers[shard].append(data)
+        self.buffered += len(data)
+        self.rows[shard] += rows
+        if self.buffered >= self.limit:
+            self.flush()
+
+    def write(self, shard, data):
+        if not self.started[shard]:
+            # first write to a shard replaces any file left by an earlier run
+            data = self.header + data
+        mode = 'ab' if self.started[shard] else 'wb'
+        self.raw_bytes[shard] += len(data)
+        if self.compresslevel is not None:
+            data = gzip.compress(data, compresslevel=self.compresslevel)
+        with open(self.paths[shard], mode) as f:
+            f.write(data)
+        self.started[shard] = True
+
+    def flush(self):
+        for shard, buf in enumerate(self.buffers):
+            if buf:
+                self.write(shard, b''.join(buf))
+                self.buffers[shard] = []
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        # every shard gets a file, so downstream jobs can be submitted by shard number
+        for shard in np.nonzero(~self.started)[0]:
+            self.write(shard, b'')
+
+def shard_numbers(block, cols, n):
+    '''
+    Shard of each line in a block: a hash of its key columns as text, so
+    the same key lands in the same shard in every file split with the same
+    number of shards, whatever the column positions or dtypes.
+    '''
+    df = pd.read_csv(io.BytesIO(block), sep='\t', header=None, usecols=cols, dtype=str,
+                     keep_default_na=False, quoting=csv.QUOTE_NONE, skip_blank_lines=False)
+    keys = pd.DataFrame({i: df[col].fillna('') for i, col in enumerate(cols)})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy() % np.uint64(n)
+
+def main():
+    parser = argparse.ArgumentParser(description='Split a TSV into shards by a hash of key columns, so all rows of a key land in one shard')
+    parser.add_argument('-i', '--input', type=str, required=True, help='Input TSV file')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Output directory for shard files and manifest.tsv')
+    parser.add_argument('-c', '--cols', type=str, required=True, help='Comma-separated list of 1-based key columns')
+    parser.add_argument('-n', '--shards', type=int, required=True, help='Number of shards')
+    parser.add_argument('--prefix', type=str, default=None, help='Shard file name prefix (default: input file name)')
+    parser.add_argument('--gzip', action='store_true', help='Write gzip-compressed shards')
+    parser.add_argument('--compresslevel', type=int, default=6, help='gzip compression level (default: 6)')
+    parser.add_argument('--buffer_mb', type=int, default=512, help='MB of lines buffered across all shards before they are appended to disk (default: 512)')
+    parser.add_argument('--block_mb', type=int, default=64, help='MB of input parsed at a time (default: 64)')
+    parser.add_argument('--no_header', action='store_true', help='Input has no header line; otherwise the header is copied to every shard')
+    args = parser.parse_args()
+    if args.block_mb <= 0:
+        parser.error('--block_mb must be positive')
+    if args.shards <= 0:
+        parser.error('--shards must be positive')
+
+    # column arguments are 1-based
+    cols = sorted({int(c) - 1 for c in args.cols.split(',')})
+    with open(args.input, 'rb') as f:
+        header = b'' if args.no_header else f.readline()
+
+    os.makedirs(args.output, exist_ok=True)
+    prefix = args.prefix or os.path.basename(args.input).split('.')[0]
+    ext = '.tsv.gz' if args.gzip else '.tsv'
+    width = len(str(args.shards - 1))
+    paths = [os.path.join(args.output, f'{prefix}.{i:0{width}d}{ext}') for i in range(args.shards)]
+
+    t = time.time()
+    writer = ShardWriter(paths, header, args)
+    for block in wrangle_helper.line_blocks(args.input, args.block_mb * 2**20, len(header)):
+        lines = np.array(block.split(b'\n')[:-1], dtype=object)
+        shard = shard_numbers(block, cols, args.shards)
+        order = np.argsort(shard, kind='stable')
+        counts = np.bincount(shard.astype(np.int64), minlength=args.shards)
+        for s, rows in enumerate(np.split(order, np.cumsum(counts)[:-1])):
+            if len(rows):
+                writer.add(s, b'\n'.join(lines[rows]) + b'\n', len(rows))
+    writer.close()
+
+    manifest = pd.DataFrame({
+        'shard': range(args.shards),
+        'path': [os.path.basename(p) for p in paths],
+        'rows': writer.rows,
+        'bytes': [os.path.getsize(p) for p in paths],
+        'raw_bytes': writer.raw_bytes,
+    })
+    manifest.to_csv(os.path.join(args.output, 'manifest.tsv'), sep='\t', index=False)
+    print(f'Wrote {manifest["rows"].sum()} rows to {args.shards} shards in {args.output} in {time.time() - t:.1f}s')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import heapq
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+TYPES = ('str', 'int', 'float', 'natural')
+NATURAL = re.compile(r'(\D*)(\d*)(.*)', re.S)
+
+def parse_keys(spec):
+    '''
+    [(0-based column, type)] for a spec like "1:natural,2:int". Columns are
+    1-based as in drop_duplicates.py; the type defaults to str.
+    '''
+    keys = []
+    for k in spec.split(','):
+        col, _, t = k.partition(':')
+        t = t or 'str'
+        assert t in TYPES, f'Unknown key type {t}, expected one of {TYPES}'
+        keys.append((int(col) - 1, t))
+    return keys
+
+def text_key(keys):
+    '''
+    Sort key of the key fields of a line (as text, in key order) as a
+    tuple. It must order lines exactly as run_order does: missing or
+    unparseable numbers last, and natural keys as (text before the first
+    number, the number, the rest), so chr2 sorts before chr10.
+    '''
+    def number(s, cast):
+        try:
+            v = cast(s)
+        except ValueError:
+            return (1, 0)
+        return (1, 0) if v != v else (0, v)
+
+    def key(values):
+        out = ()
+        for s, (_, t) in zip(values, keys):
+            if t == 'str':
+                out += (s,)
+            elif t == 'int':
+                out += number(s, int)
+            elif t == 'float':
+                out += number(s, float)
+            else:
+                prefix, digits, rest = NATURAL.match(s).groups()
+                out += (prefix, int(digits) if digits else -1, rest)
+        return out
+    return key
+
+def line_key(keys):
+    '''Sort key of a whole line, used by the merge.'''
+    key = text_key(keys)
+
+    def split(line):
+        fields = line.rstrip('\n').split('\t')
+        return key([fields[col] if col < len(fields) else '' for col, _ in keys])
+    return split
+
+def run_order(df, keys, reverse):
+    '''Stable sorting permutation of the rows of df (key columns as text), vectorized with np.lexsort.'''
+    arrays = []
+    for i, (_, t) in enumerate(keys):
+        s = df[i]
+        if t == 'str':
+            arrays.append(pd.factorize(s, sort=True)[0])
+        elif t in ('int', 'float'):
+            v = pd.to_numeric(s, errors='coerce')
+            if t == 'int':
+                # values like 1.5 or inf do not parse as int in line_key either
+                v = v.where(s.str.fullmatch(r'\s*[+-]?\d+\s*'))
+            missing = v.isna().to_numpy()
+            arrays += [missing.astype(np.int8), v.fillna(0).to_numpy()]
+        else:
+            parts = s.str.extract(r'^(\D*)(\d*)(.*)$', expand=True)
+            arrays += [pd.factorize(parts[0], sort=True)[0],
+                       parts[1].replace('', '-1').astype('int64').to_numpy(),
+                       pd.factorize(parts[2], sort=True)[0]]
+    if reverse:
+        arrays = [-a for a in arrays]
+    # lexsort sorts by the last array first
+    return np.lexsort(arrays[::-1])
+
+def sort_columns(df, keys):
+    '''
+    The components of text_key for every row of df (key columns as text,
+    in key order) as columns, so whole chunks can be compared in order as
+    a MultiIndex: numbers get a missing flag before the value, natural
+    keys are split into text, number and rest.
+    '''
+    cols = {}
+    for i, (_, t) in enumerate(keys):
+        s = df[i]
+        if t == 'str':
+            cols[f'{i}'] = s
+        elif t in ('int', 'float'):
+            v = pd.to_numeric(s, errors='coerce')
+            if t == 'int':
+                v = v.where(s.str.fullmatch(r'\s*[+-]?\d+\s*'))
+            cols[f'{i}_missing'] = v.isna().astype(np.int8)
+            cols[f'{i}_value'] = v.fillna(0)
+        else:
+            parts = s.str.extract(r'^(\D*)(\d*)(.*)$', expand=True)
+            cols[f'{i}_text'] = parts[0]
+            cols[f'{i}_number'] = parts[1].replace('', '-1').astype('int64')
+            cols[f'{i}_rest'] = parts[2]
+    return pd.DataFrame(cols)
+
+def key_frame(buf, keys):
+    '''The key fields of each line in a buffer of whole lines, as text: one column per key, in key order.'''
+    cols = sorted({col for col, _ in keys})
+    df = pd.read_csv(io.BytesIO(buf), sep='\t', header=None, usecols=cols, dtype=str,
+                     keep_default_na=False, quoting=csv.QUOTE_NONE, skip_blank_lines=False)
+    return pd.DataFrame({i: df[col].fillna('') for i, (col, _) in enumerate(keys)})
+
+# sort settings are handed to forked workers through this global
+RUNS = {}
+
+def sort_run(job):
+    '''
+    Sorts the lines in one byte range of the input and writes them to a
+    run file. Only the key columns are parsed; lines are written back
+    verbatim in sorted order.
+    '''
+    i, start, end = job
+    args, keys = RUNS['args'], RUNS['keys']
+    with open(args.input, 'rb') as f:
+        f.seek(start)
+        buf = f.read(end - start)
+    lines = buf.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    order = run_order(key_frame(buf, keys), keys, args.reverse)
+    path = os.path.join(RUNS['dir'], f'run{i}.tsv')
+    with open(path, 'wb') as out:
+        out.writelines(lines[j] + b'\n' for j in order)
+    return path
+
+def byte_ranges(path, start, run_bytes):
+    '''(run number, start, end) byte ranges of about run_bytes, ending at line boundaries.'''
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + run_bytes, size))
+            if f.tell() < size:
+                f.readline()
+            end = f.tell()
+            ranges.append((len(ranges), start, end))
+            start = end
+    return ranges
+
+def merge_runs(paths, out, key, reverse):
+    '''k-way merge of sorted run files into out with a heap; ties keep run order.'''
+    files = [open(p, newline='') for p in paths]
+    out.writelines(heapq.merge(*files, key=key, reverse=reverse))
+    for f in files:
+        f.close()
+    for p in paths:
+        os.remove(p)
+
+def main():
+    parser = argparse.ArgumentParser(description='External merge sort of a TSV by typed key columns')
+    parser.add_argument('-i', '--input', type=str, required=True, help='Input TSV file')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Sorted output file')
+    parser.add_argument('-c', '--cols', type=str, required=True, help='Comma-separated 1-based key columns with optional types str, int, float or natural, e.g. "1:natural,2:int"; join.py --presorted reads the same order with --key_types natural,int')
+    parser.add_argument('-r', '--reverse', action='store_true', help='Sort in descending order')
+    parser.add_argument('--no_header', action='store_true', help='Input has no header line')
+    parser.add_argument('--memory', type=int, default=1024, help='Memory budget in MB for the in-memory run sorts, shared by the workers (default: 1024)')
+    parser.add_argument('--workers', type=int, default=1, help='Sort runs in this many processes')
+    parser.add_argument('--fan_in', type=int, default=256, help='Most runs merged at once; more runs are merged in several passes (default: 256)')
+    parser.add_argument('--temp_dir', type=str, default=None, help='Directory for sorted runs (default: system temp)')
+    args = parser.parse_args()
+
+    keys = parse_keys(args.cols)
+    with open(args.input, newline='') as f:
+        header = '' if args.no_header else f.readline()
+    start = len(header.encode())
+
+    # a run held as lines, their split copies and the parsed key columns
+    # takes several times its size on disk
+    run_bytes = max(args.memory * 2**20 // (8 * args.workers), 1 << 20)
+    ranges = byte_ranges(args.input, start, run_bytes)
+
+    t = time.time()
+    RUNS['args'], RUNS['keys'] = args, keys
+    RUNS['dir'] = tempfile.mkdtemp(prefix='sort_tsv.', dir=args.temp_dir)
+    if args.workers > 1 and len(ranges) > 1:
+        with multiprocessing.get_context('fork').Pool(args.workers) as pool:
+            runs = pool.map(sort_run, ranges)
+    else:
+        runs = [sort_run(r) for r in ranges]
+    print(f'Sorted {len(runs)} runs in {time.time() - t:.1f}s')
+
+    t = time.time()
+    key = line_key(keys)
+    while len(runs) > args.fan_in:
+        merged = []
+        for i in range(0, len(runs), args.fan_in):
+            path = os.path.join(RUNS['dir'], f'merge{len(runs)}_{i}.tsv')
+            with open(path, 'w', newline='') as out:
+                merge_runs(runs[i:i + args.fan_in], out, key, args.reverse)
+            merged.append(path)
+        runs = merged
+    with open(args.output, 'w', newline='') as out:
+        out.write(header)
+        if len(runs) == 1:
+            with open(runs[0], newline='') as run:
+                shutil.copyfileobj(run, out)
+        else:
+            merge_runs(runs, out, key, args.reverse)
+    shutil.rmtree(RUNS['dir'])
+    print(f'Merged into {args.output} in {time.time() - t:.1f}s')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import resource
+import time
+import wrangle_helper
+
+class RowGroupWriter:
+    '''
+    Buffers Arrow tables and writes them as row groups of exactly
+    --row_group_size rows (the last one shorter), whatever size the input
+    chunks have. Every chunk is cast to the schema of the first, so a
+    column that changes type between chunks fails here rather than
+    producing an unreadable file.
+    '''
+    def __init__(self, path, schema, args):
+        self.schema = schema
+        self.size = args.row_group_size
+        self.writer = pq.ParquetWriter(path, schema, compression=args.compression,
+                                       compression_level=args.compression_level, write_statistics=True)
+        self.buffer = []
+        self.buffered = 0
+        self.rows = 0
+        self.groups = 0
+
+    def write(self, table):
+        self.buffer.append(table.cast(self.schema))
+        self.buffered += len(table)
+        while self.buffered >= self.size:
+            self.flush(self.size)
+
+    def flush(self, n):
+        table = pa.concat_tables(self.buffer)
+        self.writer.write_table(table.slice(0, n), row_group_size=n)
+        self.buffer = [table.slice(n)]
+        self.buffered = len(table) - n
+        self.rows += n
+        self.groups += 1
+
+    def close(self):
+        if self.buffered:
+            self.flush(self.buffered)
+        self.writer.close()
+
+def arrow_chunks(args):
+    '''The TSV as Arrow tables of --chunksize rows, sorted by --sort_by if given.'''
+    kwargs = wrangle_helper.read_kwargs(args.input, args)
+    if args.sort_by:
+        # a global sort needs the whole table; Arrow holds it far more compactly than pandas
+        keys = [c.strip() for c in args.sort_by.split(',')]
+        df = pd.read_csv(args.input, sep='\t', **kwargs)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        del df
+        table = table.sort_by([(k, 'ascending') for k in keys])
+        for offset in range(0, max(len(table), 1), args.chunksize):
+            yield table.slice(offset, args.chunksize)
+        return
+    for chunk in pd.read_csv(args.input, sep='\t', chunksize=args.chunksize, **kwargs):
+        yield pa.Table.from_pandas(chunk, preserve_index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert TSV to Parquet with per-row-group min/max statistics.")
+    parser.add_argument('-i', '--input', required=True, help='Input TSV file')
+    parser.add_argument('-o', '--output', required=True, help='Output Parquet file')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Rows read per batch (default: 100000)')
+    parser.add_argument('--row_group_size', type=int, default=1000000, help='Rows per row group; smaller groups let queries skip more data (default: 1000000)')
+    parser.add_argument('--sort_by', default=None, help='Comma-separated columns to sort by before writing, so row-group min/max ranges do not overlap; holds the table in memory')
+    parser.add_argument('--compression', default='zstd', help='Parquet compression codec (default: zstd)')
+    parser.add_argument('--compression_level', type=int, default=None, help='Codec compression level (default: codec default)')
+    wrangle_helper.add_read_args(parser, keys=False)
+    args = parser.parse_args()
+
+    t = time.time()
+    writer = None
+    for table in arrow_chunks(args):
+        if writer is None:
+            writer = RowGroupWriter(args.output, table.schema, args)
+        writer.write(table)
+    if writer is None:
+        empty = pd.read_csv(args.input, sep='\t', nrows=0, **wrangle_helper.read_kwargs(args.input, args))
+        writer = RowGroupWriter(args.output, pa.Schema.from_pandas(empty, preserve_index=False), args)
+    writer.close()
+
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'Wrote {writer.rows} rows in {writer.groups} row groups to {args.output} in {time.time() - t:.1f}s, peak RSS {peak:.0f} MB')
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,139 @@
 #!/usr/bin/env python3
 import argparse
 import pandas as pd
+import resource
 import sqlite3
+import time
+import wrangle_helper
+
+def bulk_pragmas(conn, args):
+    '''
+    Settings for a one-off bulk load: no rollback journal and no fsyncs,
+    so a crash mid-load leaves a corrupt file that has to be rebuilt from
+    the TSV, and a large page cache (--cache_mb) so B-tree pages are not
+    evicted and re-read between inserts. An --append load keeps a real
+    journal (DELETE, or WAL with --wal) and syncs, since the rows already
+    in the table cannot be rebuilt from this input; a failed append then
+    rolls back to the table as it was.
+    '''
+    if args.append:
+        conn.execute(f'PRAGMA journal_mode = {"WAL" if args.wal else "DELETE"}')
+        # NORMAL is crash-safe in WAL mode; a rollback journal needs FULL
+        conn.execute(f'PRAGMA synchronous = {"NORMAL" if args.wal else "FULL"}')
+    else:
+        conn.execute(f'PRAGMA journal_mode = {"WAL" if args.wal else args.journal_mode or "OFF"}')
+        conn.execute('PRAGMA synchronous = OFF')
+    conn.execute(f'PRAGMA cache_size = {-args.cache_mb * 1024}')
+
+def restore_pragmas(conn, args):
+    '''Back to SQLite's crash-safe defaults for anyone who opens the file later.'''
+    conn.execute(f'PRAGMA journal_mode = {"WAL" if args.wal else "DELETE"}')
+    conn.execute('PRAGMA synchronous = FULL')
+
+def create_table(conn, table, chunk):
+    '''Replaces table with one whose column types are inferred from the first chunk.'''
+    conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+    conn.execute(pd.io.sql.get_schema(chunk, table, con=conn))
+
+def quote(cols):
+    return ', '.join(f'"{c}"' for c in cols)
+
+def table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", [table]).fetchone() is not None
+
+def insert_chunk(conn, table, chunk, ignore=False):
+    # sqlite3 binds Python scalars only, with None for missing values
+    rows = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+    placeholders = ', '.join(['?'] * chunk.shape[1])
+    verb = 'INSERT OR IGNORE' if ignore else 'INSERT'
+    conn.executemany(f'{verb} INTO "{table}" ({quote(chunk.columns)}) VALUES ({placeholders})', rows)
+
+def primary_key_index(conn, table, keys):
+    '''
+    Unique index that makes INSERT OR IGNORE skip rows whose key is already
+    in the table (or earlier in the file). Fails, naming some of them, if
+    the table already holds duplicate keys.
+    '''
+    name = f'pk_{table}_' + '_'.join(keys)
+    try:
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{name}" ON "{table}" ({quote(keys)})')
+    except sqlite3.IntegrityError:
+        dups = f'SELECT {quote(keys)}, count(*) FROM "{table}" GROUP BY {quote(keys)} HAVING count(*) > 1'
+        n = conn.execute(f'SELECT count(*) FROM ({dups})').fetchone()[0]
+        examples = '; '.join(', '.join(map(str, row[:-1])) + f' ({row[-1]} rows)' for row in conn.execute(f'{dups} LIMIT 5'))
+        raise ValueError(f'Table {table} already has {n} duplicated values of --primary_key {", ".join(keys)}, '
+                         f'e.g. {examples}; remove them before loading with --primary_key') from None
+
+def create_indexes(conn, table, specs):
+    for spec in specs:
+        cols = [c.strip() for c in spec.split(',')]
+        name = f'idx_{table}_' + '_'.join(cols)
+        t = time.time()
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({quote(cols)})')
+        print(f'Created index {name} in {time.time() - t:.1f}s')
+
+def load(conn, args):
+    '''
+    Streams the TSV into the table --chunksize rows at a time, with every
+    chunk inserted by executemany inside a single transaction, so memory
+    is bounded by one chunk and the file is synced once at COMMIT. With
+    --append the rows are added to an existing table, and with
+    --primary_key rows whose key is already present are skipped.
+    '''
+    kwargs = wrangle_helper.read_kwargs(args.input, args)
+    keys = [c.strip() for c in args.primary_key.split(',')] if args.primary_key else []
+    append = args.append and table_exists(conn, args.table)
+    before = conn.execute(f'SELECT count(*) FROM "{args.table}"').fetchone()[0] if append else 0
+    rows = 0
+    conn.execute('BEGIN')
+    for i, chunk in enumerate(pd.read_csv(args.input, sep='\t', chunksize=args.chunksize, **kwargs)):
+        if i == 0 and not append:
+            create_table(conn, args.table, chunk)
+        if i == 0 and keys:
+            primary_key_index(conn, args.table, keys)
+        insert_chunk(conn, args.table, chunk, ignore=bool(keys))
+        rows += len(chunk)
+    if rows == 0 and not append:
+        create_table(conn, args.table, pd.read_csv(args.input, sep='\t', nrows=0, **kwargs))
+    conn.execute('COMMIT')
+    added = conn.execute(f'SELECT count(*) FROM "{args.table}"').fetchone()[0] - before
+    if added < rows:
+        print(f'Skipped {rows - added} rows whose {args.primary_key} was already present')
+    return added
 
 def main():
     parser = argparse.ArgumentParser(description="Convert TSV to SQLite database.")
     parser.add_argument('-i', '--input', required=True, help='Input TSV file')
     parser.add_argument('-o', '--output', required=True, help='Output SQLite file')
     parser.add_argument('-t', '--table', default='data', help='Table name (default: data)')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Rows read and inserted per batch (default: 100000)')
+    parser.add_argument('--journal_mode', default=None, choices=['OFF', 'MEMORY'], help='Rollback journal during a new load (default: OFF); --append always keeps a rollback journal')
+    parser.add_argument('--append', action='store_true', help='Add rows to the table if it exists instead of replacing it')
+    parser.add_argument('--primary_key', default=None, help='Comma-separated key columns; rows whose key is already in the table are not inserted')
+    parser.add_argument('--index', action='append', default=[], help='Comma-separated columns to index after the load; may be repeated')
+    parser.add_argument('--analyze', action='store_true', help='Run ANALYZE after the load so the query planner has statistics')
+    parser.add_argument('--wal', action='store_true', help='Load and leave the database in WAL mode, so readers can query while a load runs')
+    parser.add_argument('--cache_mb', type=int, default=1024, help='SQLite page cache during the load, in MB (default: 1024)')
+    wrangle_helper.add_read_args(parser, keys=False)
     args = parser.parse_args()
+    if args.append and args.journal_mode:
+        parser.error('--append keeps a rollback journal (or WAL with --wal), so --journal_mode cannot be set')
 
-    df = pd.read_csv(args.input, sep='\t')
-    conn = sqlite3.connect(args.output)
-    df.to_sql(args.table, conn, index=False, if_exists='replace')
+    t = time.time()
+    # autocommit mode, so the load's BEGIN/COMMIT are the only transaction
+    conn = sqlite3.connect(args.output, isolation_level=None)
+    bulk_pragmas(conn, args)
+    rows = load(conn, args)
+    # indexes are much faster to build once over the loaded table than to maintain row by row
+    create_indexes(conn, args.table, args.index)
+    if args.analyze:
+        conn.execute('ANALYZE')
+    restore_pragmas(conn, args)
     conn.close()
 
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'Loaded {rows} rows into {args.output}:{args.table} in {time.time() - t:.1f}s, peak RSS {peak:.0f} MB')
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
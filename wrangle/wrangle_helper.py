@@ -0,0 +1,168 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+def add_read_args(parser, keys=True):
+    parser.add_argument('--usecols',
+                        type=str,
+                        default=None,
+                        help='Comma-separated columns to read, by name or 1-based number; names not in a file are skipped and key columns are always read')
+
+    parser.add_argument('--dtypes',
+                        type=str,
+                        default=None,
+                        help='Column types as col:type,col:type or a schema file with one "col<TAB>type" per line')
+
+    if keys:
+        parser.add_argument('--no_categorical_keys',
+                            action='store_true',
+                            help='Do not read string key columns as categoricals')
+
+def parse_dtypes(spec):
+    if not spec:
+        return {}
+    if os.path.exists(spec):
+        schema = pd.read_csv(spec, sep='\t', header=None, names=['column', 'dtype'], dtype=str, comment='#')
+        return dict(zip(schema['column'], schema['dtype']))
+    return dict(c.rsplit(':', 1) for c in spec.split(','))
+
+def parse_usecols(spec, columns):
+    '''Column names for a comma-separated list of names or 1-based column numbers.'''
+    names = []
+    for c in spec.split(','):
+        if c not in columns and c.isdigit():
+            c = columns[int(c) - 1]
+        # names missing from this file may belong to the other input of a join
+        if c in columns:
+            names.append(c)
+    return names
+
+def read_kwargs(path, args, keys=(), usecols=None, sep='\t'):
+    '''
+    Keyword arguments for pd.read_csv that apply --usecols, --dtypes and
+    categorical key columns. usecols overrides --usecols; keys are always
+    read. String keys are detected from the first rows and read as
+    categoricals, so each distinct chromosome or gene name is stored once
+    rather than as one Python string per row.
+    '''
+    kwargs = {}
+    columns = pd.read_csv(path, sep=sep, nrows=0).columns.tolist()
+    if usecols is None and args.usecols:
+        usecols = parse_usecols(args.usecols, columns)
+    if usecols is not None:
+        wanted = set(usecols) | set(keys)
+        kwargs['usecols'] = [c for c in columns if c in wanted]
+
+    dtypes = parse_dtypes(args.dtypes)
+    dtypes = {c: t for c, t in dtypes.items() if c in columns}
+    if keys and not getattr(args, 'no_categorical_keys', True):
+        sample = pd.read_csv(path, sep=sep, nrows=1000, usecols=[k for k in keys if k not in dtypes])
+        for k in sample.columns:
+            if pd.api.types.is_object_dtype(sample[k]) or pd.api.types.is_string_dtype(sample[k]):
+                dtypes[k] = 'category'
+    if dtypes:
+        kwargs['dtype'] = dtypes
+    return kwargs
+
+def add_cache_args(parser):
+    parser.add_argument('--cache_dir',
+                        type=str,
+                        default=os.environ.get('WRANGLE_CACHE_DIR'),
+                        help='Cache parsed tables as Feather files in this directory (default: $WRANGLE_CACHE_DIR, unset means no cache)')
+
+    parser.add_argument('--cache_size',
+                        type=float,
+                        default=50,
+                        help='Cache size limit in GB; least recently used files are evicted (default: 50)')
+
+    parser.add_argument('--no_cache', '--no-cache',
+                        action='store_true',
+                        help='Parse the input even if a cache directory is set')
+
+def cache_path(path, cache_dir, kwargs):
+    '''Cache file for path, keyed by its location, size, mtime and the read_csv options.'''
+    st = os.stat(path)
+    fingerprint = repr((os.path.abspath(path), st.st_size, st.st_mtime_ns, sorted(kwargs.items())))
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()
+    return os.path.join(cache_dir, f'{os.path.basename(path)}.{digest}.feather')
+
+def evict(cache_dir, max_bytes):
+    files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.feather')]
+    files.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in files)
+    while files and total > max_bytes:
+        f = files.pop(0)
+        total -= os.path.getsize(f)
+        os.remove(f)
+
+def read_csv_cached(path, args, index_col=None, **kwargs):
+    '''
+    pd.read_csv with an opt-in Feather sidecar cache. The first read of a
+    file writes the parsed table to --cache_dir; later reads with the same
+    file and options memory-map the Feather file instead of parsing. Cache
+    hits refresh the file's mtime, which is the LRU order for eviction.
+    '''
+    if not getattr(args, 'cache_dir', None) or args.no_cache:
+        return pd.read_csv(path, index_col=index_col, **kwargs)
+    import pyarrow.feather as feather
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    cached = cache_path(path, args.cache_dir, kwargs)
+    if os.path.exists(cached):
+        df = feather.read_table(cached, memory_map=True).to_pandas()
+        os.utime(cached)
+    else:
+        df = pd.read_csv(path, **kwargs)
+        tmp = f'{cached}.{os.getpid()}.tmp'
+        feather.write_feather(df, tmp)
+        os.replace(tmp, cached)
+        evict(args.cache_dir, args.cache_size * 1e9)
+    if index_col is not None:
+        df = df.set_index(df.columns[index_col])
+        df.index.name = None if df.index.name.startswith('Unnamed: ') else df.index.name
+    return df
+
+def line_blocks(path, block_bytes, skip):
+    '''Blocks of whole lines of about block_bytes, after the first skip bytes.'''
+    with open(path, 'rb') as f:
+        f.seek(skip)
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                return
+            if not block.endswith(b'\n'):
+                block += f.readline()
+            if not block.endswith(b'\n'):
+                # last line of a file without a trailing newline
+                block += b'\n'
+            yield block
+
+class FingerprintSet:
+    '''
+    Set of 64-bit key fingerprints stored as a few sorted arrays of
+    decreasing size, merged like an LSM tree: 8 bytes per key and
+    vectorized membership tests with binary search. Membership is by
+    fingerprint only, so two distinct keys whose hashes collide (odds of
+    about n^2 / 2^65 for n keys) count as the same key.
+    '''
+    def __init__(self):
+        self.levels = []
+        self.size = 0
+
+    def contains(self, h):
+        found = np.zeros(len(h), dtype=bool)
+        for level in self.levels:
+            i = np.searchsorted(level, h).clip(max=len(level) - 1)
+            found |= level[i] == h
+        return found
+
+    def add(self, h):
+        if not len(h):
+            # an empty level would break the searchsorted lookup in contains
+            return
+        new = np.sort(h)
+        while self.levels and len(self.levels[-1]) <= len(new):
+            new = np.sort(np.concatenate([self.levels.pop(), new]), kind='stable')
+        self.levels.append(new)
+        self.size += len(h)